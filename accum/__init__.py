@@ -1,2 +1,3 @@
 from .values import *
 from .accumulators import *
+from .arrays import *
@@ -0,0 +1,230 @@
+import numpy as np
+import pandas as pd
+
+from dataset import NULL_CODE
+
+class GroupIndex:
+    """ assigns a slot to each group: code + 1 (0 for nulls) for a single grouping with a dictionary,
+    or the order of first appearance otherwise """
+
+    def __init__(self, dictionaries):
+        self.dictionaries = dictionaries # one per grouping, None if the grouping is not encoded
+        self.dense = len(dictionaries) == 1 and dictionaries[0] is not None
+        self.index = {}
+        self.keys = []
+
+    def __len__(self):
+        if self.dense:
+            return len(self.dictionaries[0]) + 1
+
+        return len(self.keys)
+
+    def slots(self, keys):
+        """ keys are an array of codes or a list of labels, or a tuple of them for each grouping """
+        if self.dense:
+            if not isinstance(keys, np.ndarray):
+                # labels from Spark or precomputed summaries
+                keys = self.dictionaries[0].encode(pd.Series(keys, dtype=object))
+
+            return keys.astype(np.intp) + 1
+
+        if isinstance(keys, tuple):
+            keys = list(zip(*[k.tolist() if isinstance(k, np.ndarray) else k for k in keys]))
+        elif isinstance(keys, np.ndarray):
+            keys = keys.tolist()
+
+        slots = np.empty(len(keys), dtype=np.intp)
+
+        for i, key in enumerate(keys):
+            slot = self.index.get(key)
+
+            if slot is None:
+                slot = len(self.keys)
+                self.index[key] = slot
+                self.keys.append(key)
+
+            slots[i] = slot
+
+        return slots
+
+    def key(self, slot):
+        """ returns the label (or a tuple of labels) of a slot """
+        if self.dense:
+            return self.dictionaries[0].labels[slot - 1] if slot > 0 else None
+
+        key = self.keys[slot]
+
+        if len(self.dictionaries) == 1:
+            return self.decode(self.dictionaries[0], key)
+
+        return tuple(self.decode(dictionary, k) for dictionary, k in zip(self.dictionaries, key))
+
+    @staticmethod
+    def decode(dictionary, key):
+        if dictionary is None or not isinstance(key, int):
+            return key
+
+        return dictionary.labels[key] if key != NULL_CODE else None
+
+def grow(array, length, fill=0):
+    """ returns array extended along the first axis to at least length rows """
+    if len(array) >= length:
+        return array
+
+    extra = np.full((max(length, len(array) * 2) - len(array), ) + array.shape[1:], fill, dtype=array.dtype)
+    return np.concatenate([array, extra])
+
+def changed(present, updated, since):
+    if since is None:
+        return present
+
+    return present & (updated[:len(present)] > since)
+
+class GroupedCounts:
+    """ the counts of groups in an array indexed by slot """
+
+    def __init__(self, dictionaries):
+        self.groups = GroupIndex(dictionaries)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.version = 0
+        self.updated = np.zeros(0, dtype=np.int64) # the version at which each slot last changed
+
+    def add(self, res):
+        if isinstance(res, tuple):
+            keys, counts = res
+        else:
+            # [(key, count), ...] or rows of (key1, key2, count) from Spark
+            keys = [tuple(row[:-1]) if len(row) > 2 else row[0] for row in res]
+            counts = [row[-1] for row in res]
+
+        slots = self.groups.slots(keys)
+
+        self.counts = grow(self.counts, len(self.groups))
+        np.add.at(self.counts, slots, counts)
+
+        self.version += 1
+        self.updated = grow(self.updated, len(self.counts))
+        self.updated[slots] = self.version
+
+    def columns(self, since=None):
+        """ returns (keys, counts) of groups that have been seen, or only of those that changed after the version since """
+        present = np.flatnonzero(changed(self.counts != 0, self.updated, since))
+
+        return [self.groups.key(slot) for slot in present.tolist()], self.counts[present]
+
+    def items(self, since=None):
+        keys, counts = self.columns(since)
+        return list(zip(keys, counts.tolist()))
+
+class GroupedAggregates:
+    """ (sum, ssum, count, min, max, null_count) of groups in an array indexed by slot """
+
+    SUM, SSUM, COUNT, MIN, MAX, NULL_COUNT = range(6)
+
+    def __init__(self, dictionaries):
+        self.groups = GroupIndex(dictionaries)
+        self.stats = self.empty(0)
+        self.version = 0
+        self.updated = np.zeros(0, dtype=np.int64)
+
+    @staticmethod
+    def empty(length):
+        stats = np.zeros((length, 6))
+        stats[:, GroupedAggregates.MIN] = np.inf
+        stats[:, GroupedAggregates.MAX] = -np.inf
+        return stats
+
+    def add(self, res):
+        if isinstance(res, tuple):
+            keys, stats = res
+        else:
+            # [(key, sum, ssum, count, min, max, null_count), ...]
+            keys = [row[0] for row in res]
+            stats = np.array([row[1:] for row in res], dtype=float).reshape(len(res), 6)
+
+        slots = self.groups.slots(keys)
+
+        if len(self.stats) < len(self.groups):
+            self.stats = np.concatenate([self.stats, self.empty(max(len(self.groups), len(self.stats) * 2) - len(self.stats))])
+
+        for column in (self.SUM, self.SSUM, self.COUNT, self.NULL_COUNT):
+            np.add.at(self.stats[:, column], slots, stats[:, column])
+
+        # groups without a non-null value have NaN as their min and max, which must not hide the others
+        np.fmin.at(self.stats[:, self.MIN], slots, stats[:, self.MIN])
+        np.fmax.at(self.stats[:, self.MAX], slots, stats[:, self.MAX])
+
+        self.version += 1
+        self.updated = grow(self.updated, len(self.stats))
+        self.updated[slots] = self.version
+
+    def columns(self, since=None):
+        """ returns (keys, an array of (sum, ssum, count, min, max, null_count) for each key) of groups
+        that have been seen, or only of those that changed after the version since """
+        present = np.flatnonzero(changed(self.stats[:, self.COUNT] + self.stats[:, self.NULL_COUNT] > 0, self.updated, since))
+        stats = self.stats[present]
+
+        # groups without a non-null value have no min and max
+        stats[np.isinf(stats[:, self.MIN]), self.MIN] = np.nan
+        stats[np.isinf(stats[:, self.MAX]), self.MAX] = np.nan
+
+        return [self.groups.key(slot) for slot in present.tolist()], stats
+
+    def items(self, since=None):
+        keys, stats = self.columns(since)
+        return [(key, ) + tuple(row) for key, row in zip(keys, stats.tolist())]
+
+class BinnedCounts:
+    """ the counts of a 1D or 2D histogram in a dense array whose last index along each axis holds nulls """
+
+    def __init__(self, shape):
+        self.counts = np.zeros(shape, dtype=np.int64)
+        self.version = 0
+        self.updated = np.zeros(shape, dtype=np.int64)
+
+    def add(self, res):
+        self.version += 1
+
+        if isinstance(res, np.ndarray):
+            self.counts += res
+            self.updated[res != 0] = self.version
+            return
+
+        # [(bin, count), ...] or [((bin1, bin2), count), ...] from Spark, with None (or (None, )) for nulls
+        for key, count in res:
+            index = self.index(key)
+            self.counts[index] += count
+            self.updated[index] = self.version
+
+    def index(self, key):
+        if self.counts.ndim == 1:
+            return self.bin(key, 0)
+
+        return tuple(self.bin(k, axis) for axis, k in enumerate(key))
+
+    def bin(self, key, axis):
+        if isinstance(key, tuple):
+            key = key[0]
+
+        return self.counts.shape[axis] - 1 if key is None else key
+
+    def columns(self, since=None):
+        """ returns (bins, counts) of non-empty bins, or only of those that changed after the version since,
+        where bins is an array of bin indices with a column for each axis and -1 for nulls """
+        present = np.argwhere(changed(self.counts != 0, self.updated, since))
+        counts = self.counts[tuple(present.T)]
+
+        nulls = np.array(self.counts.shape) - 1
+        bins = np.where(present == nulls, -1, present)
+
+        return bins, counts
+
+    def items(self, since=None):
+        """ returns [(bin, count), ...] or [((bin1, bin2), count), ...] with None for nulls """
+        bins, counts = self.columns(since)
+        keys = [tuple(None if i < 0 else i for i in row) for row in bins.tolist()]
+
+        if self.counts.ndim == 1:
+            keys = [key[0] for key in keys]
+
+        return list(zip(keys, counts.tolist()))
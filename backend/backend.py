@@ -1,8 +1,30 @@
+import copy
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+
 from dataset import *
+from query import SampleScan
 
 class BackendBase:
     def __init__(self, config):
         self.config = config
+
+        # the maximum number of job batches running at the same time
+        self.max_in_flight = config.getint('backend', 'max_in_flight', fallback=1)
+
+    def run_shared(self, jobs):
+        return [self.run(job) for job in jobs]
+
+    def submit(self, jobs, pool=None):
+        """ runs jobs and returns a future of their results. pool is the name of the session that submits them """
+        future = Future()
+
+        try:
+            future.set_result(self.run_shared(jobs))
+        except Exception as e:
+            future.set_exception(e)
+
+        return future
         
 class SparkBackend(BackendBase):    
     config_name = 'spark'
@@ -15,11 +37,21 @@ class SparkBackend(BackendBase):
 
         self.pyspark = pyspark
 
+        # each session runs its jobs in its own FAIR scheduler pool, so that the jobs of one session do not queue up behind another's
+        self.pools = config.getboolean('backend', 'spark_pools', fallback=True)
+
         version = config['server']['version']
-        spark = SparkSession.builder.appName(f'ProReveal Spark Engine {version}')\
-            .getOrCreate()
+        builder = SparkSession.builder.appName(f'ProReveal Spark Engine {version}')
+
+        if self.pools:
+            builder = builder.config('spark.scheduler.mode', 'FAIR')
+
+        spark = builder.getOrCreate()
 
         self.spark = spark
+
+        # Spark actions are submitted from threads so that max_in_flight jobs run on the cluster at the same time
+        self.executor = ThreadPoolExecutor(self.max_in_flight)
         
     def load(self, path):
         dataset = SparkDataset(self, path)
@@ -34,13 +66,25 @@ class SparkBackend(BackendBase):
             'backend': 'spark',
             'sparkVersion': spark.version,
             'master': spark.sparkContext.master,
-            'uiWebUrl': spark.sparkContext.uiWebUrl
+            'uiWebUrl': spark.sparkContext.uiWebUrl,
+            'maxInFlight': self.max_in_flight
         }
 
     def run(self, job):
         return job.run_spark(self.spark)
 
+    def run_in_pool(self, jobs, pool):
+        if pool is not None:
+            # a local property of the thread, which Spark applies to the jobs that the thread submits
+            self.spark.sparkContext.setLocalProperty('spark.scheduler.pool', pool)
+
+        return self.run_shared(jobs)
+
+    def submit(self, jobs, pool=None):
+        return self.executor.submit(self.run_in_pool, jobs, pool if self.pools else None)
+
     def stop(self):
+        self.executor.shutdown(wait=False)
         self.spark.stop()
             
 class LocalBackend(BackendBase):
@@ -49,20 +93,142 @@ class LocalBackend(BackendBase):
     def __init__(self, config):
         super().__init__(config)
 
+        # jobs run on real threads so that the eventlet hub only handles sockets
+        self.executor = ThreadPoolExecutor(self.max_in_flight)
+
     def load(self, path):
         dataset = LocalDataset(self, path)
         dataset.load()
+        self.dataset = dataset
         return dataset
     
     def get_welcome(self):
         config = self.config
-        return {
+        welcome = {
             'version': config['server']['version'],
             'backend': 'local'
         }
 
+        if self.dataset.cache is not None:
+            welcome['cache'] = self.dataset.cache.stats()
+
+        return welcome
+
     def run(self, job):
         return job.run()
 
+    def run_shared(self, jobs):
+        # jobs that target the same sample (or slice) share a single scan
+        scans = {}
+        results = []
+
+        for job in jobs:
+            if id(job.sample) not in scans:
+                scans[id(job.sample)] = SampleScan(job.sample)
+
+            results.append(job.run(scans[id(job.sample)]))
+
+        for scan in scans.values():
+            scan.summarize()
+
+        return results
+
+    def submit(self, jobs, pool=None):
+        return self.executor.submit(self.run_shared, jobs)
+
+    def stop(self):
+        self.executor.shutdown(wait=False)
+
+worker_frames = None
+worker_blocks = None
+worker_bitmap_indexes = None # inherited from the server when the workers are forked
+
+def init_worker(spec):
+    global worker_frames, worker_blocks
+    worker_frames, worker_blocks = SharedColumns.attach(spec)
+
+def run_in_worker(blocks, jobs):
+    """ blocks[i] is (sample index, start, end) of jobs[i], where start and end are None for a whole sample """
+    scans = {}
+    results = []
+
+    for block, job in zip(blocks, jobs):
+        if block not in scans:
+            index, start, end = block
+
+            sample = LocalSample(index, worker_frames[index])
+            sample.bitmap_index = worker_bitmap_indexes[index]
+
+            if start is not None:
+                sample = sample.slice(start, end)
+
+            scans[block] = SampleScan(sample)
+
+        job.sample = scans[block].sample
+        results.append(job.run(scans[block]))
+
+    return results
+
+class LocalParallelBackend(LocalBackend):
+    config_name = 'local_parallel'
+
+    def __init__(self, config):
+        super().__init__(config)
+
+        self.num_workers = config.getint('backend', 'workers', fallback=os.cpu_count())
+        self.max_in_flight = config.getint('backend', 'max_in_flight', fallback=self.num_workers)
+
+    def load(self, path):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        dataset = super().load(path)
+
+        # samples now read from shared memory, so the decoded frames can be freed
+        self.columns = SharedColumns(dataset.samples)
+        for sample, frame in zip(dataset.samples, self.columns.frames().values()):
+            sample.df = frame
+
+            # scans run in the workers, so lazy zone maps and summaries are filled now that every column has been read
+            if sample.zone_map is not None:
+                sample.zone_map.fill(sample.zone_map.names, lambda name: frame[name])
+
+            if isinstance(sample.frequencies, FrequencySummaries):
+                sample.frequencies.fill(sample.frequencies.fields, lambda name: frame[name])
+
+        global worker_bitmap_indexes
+        worker_bitmap_indexes = {sample.index: sample.bitmap_index for sample in dataset.samples}
+
+        # replaces the thread pool of LocalBackend; fork the workers now, before the server opens any sockets
+        self.executor = ProcessPoolExecutor(self.num_workers,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=init_worker, initargs=(self.columns.spec(), ))
+        self.executor.submit(int).result()
+
+        return dataset
+
+    def get_welcome(self):
+        welcome = super().get_welcome()
+        welcome['workers'] = self.num_workers
+        return welcome
+
+    def submit(self, jobs, pool=None):
+        blocks = []
+        detached = []
+
+        for job in jobs:
+            sample = job.sample
+            blocks.append((sample.index, getattr(sample, 'start', None), getattr(sample, 'end', None)))
+
+            # only send what a worker needs to run the job, not the query or the dataset
+            job = copy.copy(job)
+            job.sample = None
+            job.query = None
+            job.dataset = None
+            detached.append(job)
+
+        return self.executor.submit(run_in_worker, blocks, detached)
+
     def stop(self):
-        return
\ No newline at end of file
+        super().stop()
+        self.columns.close()
@@ -1,3 +1,7 @@
 from .local_dataset import *
 from .spark_dataset import * 
 from .field import *
+from .shared_dataset import *
+from .dictionary import *
+from .zone_map import *
+from .bitmap_index import *
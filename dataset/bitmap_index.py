@@ -0,0 +1,115 @@
+import numpy as np
+
+from .field import CategoricalField
+
+class Bitmap:
+    """ the rows of a sample that hold a value, stored like a roaring container:
+    sorted row ids if the value is sparse or packed bits if it is dense """
+
+    def __init__(self, num_rows, count, rows=None, bits=None):
+        self.num_rows = num_rows
+        self.count = count
+        self.rows = rows
+        self.bits = bits
+
+    def __len__(self):
+        return self.count
+
+    @staticmethod
+    def from_rows(rows, num_rows):
+        """ rows must be sorted """
+        # packed bits take num_rows / 8 bytes and row ids 4 bytes per row
+        if len(rows) * 32 > num_rows:
+            bits = np.zeros(num_rows, dtype=bool)
+            bits[rows] = True
+            return Bitmap(num_rows, len(rows), bits=np.packbits(bits))
+
+        return Bitmap(num_rows, len(rows), rows=rows.astype(np.uint32))
+
+    @staticmethod
+    def empty(num_rows):
+        return Bitmap(num_rows, 0, rows=np.empty(0, dtype=np.uint32))
+
+    def to_rows(self):
+        if self.rows is not None:
+            return self.rows
+
+        return np.flatnonzero(np.unpackbits(self.bits, count=self.num_rows)).astype(np.uint32)
+
+    def intersect(self, rows):
+        """ returns the subset of sorted rows that are in the bitmap, in time proportional to len(rows) """
+        if self.bits is not None:
+            return rows[((self.bits[rows >> 3] >> (7 - (rows & 7))) & 1).astype(bool)]
+
+        if len(self.rows) == 0:
+            return rows[:0]
+
+        positions = np.minimum(np.searchsorted(self.rows, rows), len(self.rows) - 1)
+        return rows[self.rows[positions] == rows]
+
+class BitmapIndex:
+    """ bitmaps of the rows of each code for the categorical fields that have "index": "bitmap" in metadata.json """
+
+    def __init__(self, num_rows, sample=None, names=()):
+        self.num_rows = num_rows
+        self.bitmaps = {} # field name -> {code: Bitmap}
+
+        # a lazy index reads the columns of names from sample.df when they are first asked for
+        self.sample = sample
+        self.names = set(names)
+
+    def has(self, name):
+        return name in self.bitmaps or name in self.names
+
+    def get(self, name, code):
+        """ returns the bitmap of code, which is empty if no row in the sample holds code """
+        if name not in self.bitmaps:
+            self.bitmaps[name] = BitmapIndex.bitmaps_of(np.asarray(self.sample.df[name]), self.num_rows)
+
+        bitmap = self.bitmaps[name].get(code)
+
+        if bitmap is None:
+            return Bitmap.empty(self.num_rows)
+
+        return bitmap
+
+    @staticmethod
+    def bitmaps_of(codes, num_rows):
+        # the rows of each code are a contiguous and sorted run after a stable sort
+        rows = np.argsort(codes, kind='stable')
+        sorted_codes = codes[rows]
+        present, starts = np.unique(sorted_codes, return_index=True)
+        ends = np.append(starts[1:], len(rows))
+
+        return {code: Bitmap.from_rows(rows[start:end], num_rows)
+            for code, start, end in zip(present.tolist(), starts.tolist(), ends.tolist()) if code >= 0}
+
+    @staticmethod
+    def names_of(df, fields):
+        return [field.name for field in fields
+            if isinstance(field, CategoricalField) and field.index == 'bitmap' and field.name in df.columns]
+
+    @staticmethod
+    def from_frame(df, fields):
+        """ returns None if no field is indexed """
+        names = BitmapIndex.names_of(df, fields)
+
+        if len(names) == 0:
+            return None
+
+        index = BitmapIndex(len(df))
+
+        for name in names:
+            index.bitmaps[name] = BitmapIndex.bitmaps_of(np.asarray(df[name]), len(df))
+
+        return index
+
+    @staticmethod
+    def lazy(sample, fields):
+        """ returns None if no field is indexed """
+        names = BitmapIndex.names_of(sample.df, fields)
+
+        if len(names) == 0:
+            return None
+
+        return BitmapIndex(sample.num_rows, sample, names)
@@ -0,0 +1,57 @@
+import itertools
+import threading
+
+import numpy as np
+import pandas as pd
+
+NULL_CODE = -1
+
+class Dictionary:
+    """ an append-only mapping between the labels of a categorical field and integer codes """
+
+    # dictionaries are pickled by reference so that jobs sent to forked workers stay small
+    registry = {}
+    ids = itertools.count()
+
+    def __init__(self):
+        self.labels = []
+        self.index = {}
+        self.lock = threading.Lock()
+
+        self.id = next(Dictionary.ids)
+        Dictionary.registry[self.id] = self
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __reduce__(self):
+        return (Dictionary.lookup, (self.id, ))
+
+    @staticmethod
+    def lookup(id):
+        return Dictionary.registry[id]
+
+    def code(self, label):
+        """ returns the code of label, or None if the label has never been seen """
+        return self.index.get(label)
+
+    def encode(self, values):
+        """ returns int32 codes for values, with NULL_CODE for nulls """
+        codes, uniques = pd.factorize(values)
+
+        # the last entry maps the -1 of pd.factorize to NULL_CODE
+        mapping = np.empty(len(uniques) + 1, dtype=np.int32)
+        mapping[-1] = NULL_CODE
+
+        with self.lock:
+            for i, label in enumerate(uniques.tolist()):
+                code = self.index.get(label)
+
+                if code is None:
+                    code = len(self.labels)
+                    self.labels.append(label)
+                    self.index[label] = code
+
+                mapping[i] = code
+
+        return mapping[codes]
@@ -70,11 +70,15 @@ class FieldTrait:
 
             return QuantitativeField(name, data_type, min, max, num_bins)
         elif vl_type == VlType.Ordinal.value:
-            return OrdinalField(name, data_type)
+            field = OrdinalField(name, data_type)
         elif vl_type == VlType.Nominal.value:
-            return NominalField(name, data_type)
+            field = NominalField(name, data_type)
+        else:
+            field = KeyField(name, data_type)
 
-        return KeyField(name, data_type)
+        field.index = json.get('index', None)
+
+        return field
 
 class QuantitativeField(FieldTrait):
     vl_type = VlType.Quantitative
@@ -100,7 +104,11 @@ class QuantitativeField(FieldTrait):
 
         return number
 class CategoricalField(FieldTrait):
-    pass
+    # set by a local dataset, which stores the values of the field as codes
+    dictionary = None
+
+    # 'bitmap' to build a bitmap index of the field in each sample
+    index = None
 
 class OrdinalField(CategoricalField):
     vl_type = VlType.Ordinal
@@ -1,16 +1,275 @@
 import os
 import json
 import re
+import threading
+from collections import OrderedDict
 
+import numpy as np
 import pandas as pd
 
-from .field import FieldTrait, QuantitativeField
+from .field import FieldTrait, QuantitativeField, CategoricalField, NominalField, OrdinalField
+from .dictionary import Dictionary
+from .zone_map import ZoneMap
+from .bitmap_index import BitmapIndex
+
+ARROW_EXTENSIONS = ['.arrow', '.feather', '.ipc']
+PARQUET_EXTENSIONS = ['.parquet']
+
+class LazyFrame:
+    """ a DataFrame-like view that reads a column only when it is accessed """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.dictionaries = {}
+        self.codes = {}
+
+    def __getitem__(self, name):
+        if name in self.dictionaries:
+            # categorical columns are encoded on first access and kept as codes
+            if name not in self.codes:
+                self.codes[name] = self.dictionaries[name].encode(self.read(name))
+
+            return self.codes[name]
+
+        return self.read(name)
+
+class ArrowFrame(LazyFrame):
+    """ a view of an Arrow table that converts a column only when it is accessed """
+
+    def __init__(self, table):
+        super().__init__(table.column_names)
+        self.table = table
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def read(self, name):
+        return self.table.column(name).to_pandas()
+
+    def slice(self, start, end):
+        frame = ArrowFrame(self.table.slice(start, end - start))
+        frame.dictionaries = self.dictionaries
+        return frame
+
+class ParquetFrame(LazyFrame):
+    """ a view of a Parquet file that reads a column only when it is accessed """
+
+    def __init__(self, path):
+        import pyarrow.parquet as pq
+
+        self.path = path
+        self.metadata = pq.read_metadata(path)
+        super().__init__(self.metadata.schema.to_arrow_schema().names)
+
+    def __len__(self):
+        return self.metadata.num_rows
+
+    def read(self, name):
+        import pyarrow.parquet as pq
+
+        return pq.read_table(self.path, columns=[name], memory_map=True).column(name).to_pandas()
+
+def read_frame(path, lazy=True):
+    """ reads a JSON file into a DataFrame, or maps an Arrow IPC/Feather or Parquet file without decoding it """
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension in ARROW_EXTENSIONS:
+        import pyarrow as pa
+
+        # the table points into the mapped file, so columns are paged in on demand
+        return ArrowFrame(pa.ipc.open_file(pa.memory_map(path, 'r')).read_all())
+    elif extension in PARQUET_EXTENSIONS:
+        if not lazy:
+            import pyarrow.parquet as pq
+            return ArrowFrame(pq.read_table(path, memory_map=True))
+
+        return ParquetFrame(path)
+
+    with open(path, encoding='utf8') as fin:
+        data = json.load(fin)
+
+    return pd.DataFrame.from_records(data)
+
+def slice_frame(df, start, end):
+    if isinstance(df, pd.DataFrame):
+        return df.iloc[start:end]
+
+    return df.slice(start, end)
+
+def frame_bytes(df):
+    if isinstance(df, pd.DataFrame):
+        return int(df.memory_usage(deep=True).sum())
+    elif isinstance(df, ArrowFrame):
+        return df.table.nbytes + sum(codes.nbytes for codes in df.codes.values())
+
+    return 0
+
+def frequency_summary(field, codes):
+    """ returns [(label, count), ...] of the codes of a nominal or ordinal field, with None as the label of nulls """
+    labels = field.dictionary.labels
+    counts = np.bincount(np.asarray(codes) + 1, minlength=len(labels) + 1)
+
+    return [(labels[i - 1] if i > 0 else None, int(counts[i])) for i in np.flatnonzero(counts)]
+
+def summarized_fields(df, fields):
+    return [field for field in fields if isinstance(field, (NominalField, OrdinalField)) and field.name in df.columns]
+
+def frequency_summaries(df, fields):
+    """ returns {name: [(label, count), ...]} for the nominal and ordinal fields, with None as the label of nulls """
+    return {field.name: frequency_summary(field, df[field.name]) for field in summarized_fields(df, fields)}
+
+class FrequencySummaries:
+    """ the frequency summaries of a sample that is read lazily, which only has the summaries of the fields
+    whose columns a scan has read (see fill) """
+
+    def __init__(self, df, fields):
+        self.fields = {field.name: field for field in summarized_fields(df, fields)}
+        self.summaries = {}
+
+    def __contains__(self, name):
+        return name in self.summaries
+
+    def __getitem__(self, name):
+        return self.summaries[name]
+
+    def get(self, name, default=None):
+        return self.summaries.get(name, default)
+
+    def fill(self, names, read):
+        """ counts the values of the fields in names that are not summarized yet, where read(name) returns a column """
+        for name in names:
+            if name in self.fields and name not in self.summaries:
+                self.summaries[name] = frequency_summary(self.fields[name], read(name))
+
+class SampleCache:
+    """ keeps the most recently used samples decoded in memory within a budget of bytes """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.entries = OrderedDict() # sample index -> (df, bytes)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, sample):
+        with self.lock:
+            if sample.index in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(sample.index)
+                return self.entries[sample.index][0]
+
+            self.misses += 1
+
+        # decode outside the lock so that hits are not blocked by a slow load
+        df = sample.load()
+        self.put(sample, df)
+
+        return df
+
+    def put(self, sample, df):
+        with self.lock:
+            if sample.index in self.entries:
+                return
+
+            size = frame_bytes(df)
+            self.entries[sample.index] = (df, size)
+            self.bytes += size
+
+            # always keep the sample that was just loaded, even if it exceeds the budget alone
+            while self.bytes > self.budget and len(self.entries) > 1:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def stats(self):
+        return {
+            'budget': self.budget,
+            'bytes': self.bytes,
+            'numSamples': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+class SampleSlice:
+    """ the rows [start, end) of a sample, which a job processes when the sample is split to meet the latency target """
+
+    def __init__(self, parent, start, end):
+        self.parent = parent
+        self.index = parent.index
+        self.start = start
+        self.end = end
+        self.num_rows = end - start
+
+        # the zone map of the whole sample still bounds the values of the slice
+        self.zone_map = parent.zone_map
+
+        # the row ids of the index and the counts of the summaries are of the whole sample
+        self.bitmap_index = None
+        self.frequencies = None
+
+    @property
+    def df(self):
+        return slice_frame(self.parent.df, self.start, self.end)
+
+    @property
+    def splittable(self):
+        return self.parent.splittable
+
+    def slice(self, start, end):
+        return SampleSlice(self.parent, self.start + start, self.start + end)
 
 class LocalSample:
-    def __init__(self, index, df):
+    def __init__(self, index, df=None, path=None, num_rows=None, cache=None, dataset=None, zone_map=None):
         self.index = index
-        self.df = df
-        self.num_rows = len(df.index)
+        self.frame = df
+        self.path = path
+        self.cache = cache
+        self.dataset = dataset
+        self.num_rows = num_rows
+        self.zone_map = zone_map
+        self.bitmap_index = None
+        self.frequencies = None
+
+        if num_rows is None and df is not None:
+            self.num_rows = len(df)
+
+    @property
+    def df(self):
+        if self.frame is not None:
+            return self.frame
+
+        return self.cache.get(self)
+
+    @df.setter
+    def df(self, df):
+        self.frame = df
+
+    @property
+    def splittable(self):
+        # a Parquet file that is not decoded is read a whole column at a time
+        return not isinstance(self.frame, ParquetFrame)
+
+    def slice(self, start, end):
+        return SampleSlice(self, start, end)
+
+    def load(self):
+        df = self.dataset.encode(read_frame(self.path, lazy=False))
+
+        # batches that are not in memory at startup get their zone maps when first decoded
+        if self.zone_map is None:
+            self.zone_map = ZoneMap.from_frame(df, self.dataset.fields)
+
+        # row ids do not change between decodes, so the index outlives an eviction
+        if self.bitmap_index is None:
+            self.bitmap_index = BitmapIndex.from_frame(df, self.dataset.fields)
+
+        if self.frequencies is None and self.dataset.summarize:
+            self.frequencies = frequency_summaries(df, self.dataset.fields)
+
+        return df
 
 class LocalDataset:    
     def __init__(self, backend, path):
@@ -18,6 +277,14 @@ class LocalDataset:
         self.metadata_path = os.path.join(path, 'metadata.json')
 
         self.path = path        
+
+        self.cache = None
+        cache_bytes = backend.config.getint('backend', 'cache_bytes', fallback=None)
+        if cache_bytes is not None:
+            self.cache = SampleCache(cache_bytes)
+
+        # count the values of nominal and ordinal fields in each sample so that unfiltered frequencies need no scan
+        self.summarize = backend.config.getboolean('backend', 'frequency_summaries', fallback=False)
     
     def load(self):        
         with open(self.metadata_path, encoding='utf8') as fin:
@@ -25,6 +292,13 @@ class LocalDataset:
 
         self.name = self.metadata['source']['name'] or os.path.basename(os.path.normpath(self.path))
 
+        self.fields = [FieldTrait.from_json(fieldTrait) for fieldTrait in self.metadata['fields']]
+
+        for field in self.fields:
+            if isinstance(field, CategoricalField):
+                # codes are shared by all samples, so partial results of samples can be merged by code
+                field.dictionary = Dictionary()
+
         if 'path' in self.metadata['source']:
             # if a dataset is a single file, read and split the dataset by sample_rows
 
@@ -35,20 +309,17 @@ class LocalDataset:
 
             sample_rows = self.backend.config.getint('backend', 'sample_rows')
 
-            with open(abs_source_path, encoding='utf8') as fin:
-                data = json.load(fin)
-        
-            df = pd.DataFrame.from_records(data)
-            num_rows = len(df.index)
+            df = self.encode(read_frame(abs_source_path, lazy=False))
+            num_rows = len(df)
 
-            self.samples = [LocalSample(i, df.iloc[s:min(s + sample_rows, num_rows)]) for i, s in enumerate(range(0, num_rows, sample_rows))]
+            self.samples = [LocalSample(i, slice_frame(df, s, min(s + sample_rows, num_rows))) for i, s in enumerate(range(0, num_rows, sample_rows))]
         elif 'batches' in self.metadata['source']:
             # if a dataset consists of multiple files, use each file as a batch
 
             self.samples = []
 
             num_rows = 0
-            
+
             for i, batch in enumerate(self.metadata['source']['batches']):
                 path = batch['path']
 
@@ -57,21 +328,59 @@ class LocalDataset:
                     path                
                 ))
 
-                with open(abs_path, encoding='utf8') as fin:
-                    data = json.load(fin)
-        
-                df = pd.DataFrame.from_records(data)
+                zone_map = None
+                if 'zoneMap' in batch:
+                    zone_map = ZoneMap.from_json(batch['zoneMap'])
+
+                frequencies = None
+                if 'frequencies' in batch:
+                    frequencies = {name: [tuple(entry) for entry in counts] for name, counts in batch['frequencies'].items()}
+
+                if self.cache is not None:
+                    # batches are decoded on first use and may be evicted later
+                    sample = LocalSample(i, path=abs_path, num_rows=batch.get('numRows', None), cache=self.cache, dataset=self, zone_map=zone_map)
+                    sample.frequencies = frequencies
 
-                num_rows += batch.get('numRows', None) or len(df.index)
+                    if sample.num_rows is None:
+                        df = sample.load()
+                        sample.num_rows = len(df)
+                        self.cache.put(sample, df)
+                else:
+                    sample = LocalSample(i, self.encode(read_frame(abs_path)), zone_map=zone_map)
+                    sample.frequencies = frequencies
 
-                self.samples.append(LocalSample(i, df))            
+                num_rows += batch.get('numRows', None) or sample.num_rows
+
+                self.samples.append(sample)
         else:
             raise Exception('Either "path" or "batches" must be given in the "source" property of metadata.json')
 
-        self.fields = []
-        for fieldTrait in self.metadata['fields']:
-            field = FieldTrait.from_json(fieldTrait)
+        for sample in self.samples:
+            if sample.frame is None:
+                continue
+
+            if isinstance(sample.frame, LazyFrame):
+                # columns of mapped batches are read on demand, so their zone maps, indexes, and summaries are built
+                # a column at a time by the scans that read them rather than by reading every column at startup
+                if sample.zone_map is None:
+                    sample.zone_map = ZoneMap.lazy(sample.frame, self.fields)
 
+                sample.bitmap_index = BitmapIndex.lazy(sample, self.fields)
+
+                if sample.frequencies is None and self.summarize:
+                    sample.frequencies = FrequencySummaries(sample.frame, self.fields)
+
+                continue
+
+            if sample.zone_map is None:
+                sample.zone_map = ZoneMap.from_frame(sample.frame, self.fields)
+
+            sample.bitmap_index = BitmapIndex.from_frame(sample.frame, self.fields)
+
+            if sample.frequencies is None and self.summarize:
+                sample.frequencies = frequency_summaries(sample.frame, self.fields)
+
+        for field in self.fields:
             if isinstance(field, QuantitativeField):
                 if field.min is None:
                     field.min = field.nice(self.samples[0].df[field.name].min())
@@ -81,11 +390,20 @@ class LocalDataset:
 
                 if field.num_bins is None:
                     field.num_bins = QuantitativeField.DEFAULT_NUM_BINS
-
-            self.fields.append(field)
                 
         self.num_rows = num_rows
 
+    def encode(self, df):
+        """ replaces the values of categorical fields with their codes """
+        dictionaries = {field.name: field.dictionary for field in self.fields 
+            if isinstance(field, CategoricalField) and field.name in df.columns}
+
+        if isinstance(df, pd.DataFrame):
+            return df.assign(**{name: dictionary.encode(df[name]) for name, dictionary in dictionaries.items()})
+
+        df.dictionaries = dictionaries
+        return df
+
     def get_field_by_name(self, name):
         for field in self.fields:
             if field.name == name:
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+class SharedFrame:
+    """ a read-only, DataFrame-like view of a row range of columns in shared memory """
+
+    def __init__(self, columns, labels, start, end):
+        self.columns = columns
+        self.labels = labels
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __getitem__(self, name):
+        values = self.columns[name][self.start:self.end]
+
+        if name in self.labels:
+            # string columns are stored as codes, where -1 (the last label) is null
+            return self.labels[name].take(values)
+
+        return values
+
+    def slice(self, start, end):
+        return SharedFrame(self.columns, self.labels, self.start + start, self.start + end)
+
+class SharedColumns:
+    """ copies the columns of all samples into shared memory blocks, one per column """
+
+    def __init__(self, samples):
+        from multiprocessing.shared_memory import SharedMemory
+
+        self.blocks = []
+        self.specs = {}
+        self.columns = {}
+        self.labels = {}
+        self.offsets = []
+
+        start = 0
+        for sample in samples:
+            self.offsets.append((start, start + sample.num_rows))
+            start += sample.num_rows
+
+        try:
+            for name in samples[0].df.columns:
+                # lazy frames return the codes of categorical columns as arrays rather than Series
+                series = pd.concat([pd.Series(sample.df[name]) for sample in samples], ignore_index=True)
+
+                if not pd.api.types.is_numeric_dtype(series):
+                    codes, labels = pd.factorize(series)
+                    values = codes.astype(np.int32)
+                    self.labels[name] = np.append(np.asarray(labels, dtype=object), np.nan)
+                else:
+                    values = series.to_numpy()
+
+                block = SharedMemory(create=True, size=max(values.nbytes, 1))
+                self.blocks.append(block)
+
+                column = np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)
+                column[:] = values
+
+                self.columns[name] = column
+                self.specs[name] = (block.name, values.dtype.str, len(values))
+        except Exception:
+            # shared memory outlives the process unless it is unlinked
+            self.close()
+            raise
+
+    def frames(self):
+        return {i: SharedFrame(self.columns, self.labels, start, end) for i, (start, end) in enumerate(self.offsets)}
+
+    def spec(self):
+        """ returns what a worker process needs to attach to the columns """
+        return self.specs, self.labels, self.offsets
+
+    @staticmethod
+    def attach(spec):
+        """ returns ({sample index: SharedFrame}, blocks) built from spec without copying """
+        from multiprocessing.shared_memory import SharedMemory
+
+        specs, labels, offsets = spec
+        blocks = []
+        columns = {}
+
+        for name, (block_name, dtype, length) in specs.items():
+            block = SharedMemory(name=block_name)
+            blocks.append(block)
+            columns[name] = np.ndarray((length, ), dtype=np.dtype(dtype), buffer=block.buf)
+
+        frames = {i: SharedFrame(columns, labels, start, end) for i, (start, end) in enumerate(offsets)}
+
+        return frames, blocks
+
+    def close(self):
+        self.columns = {}
+
+        for block in self.blocks:
+            block.unlink()
+
+        self.blocks = []
@@ -4,13 +4,16 @@ import re
 import random
 
 from .field import FieldTrait, QuantitativeField
+from .zone_map import ZoneMap
 
 class SparkSample:
-    def __init__(self, index, path, df, num_rows):
+    def __init__(self, index, path, df, num_rows, zone_map=None):
         self.index = index
         self.path = path
         self.df = df
         self.num_rows = num_rows
+        self.zone_map = zone_map
+        self.frequencies = None
 
 class SparkDataset:    
     def __init__(self, backend, path):
@@ -49,6 +52,13 @@ class SparkDataset:
             else:
                 sample = SparkSample(i, path, df, df.count())
 
+            # computing zone maps would take a pass over every batch, so only use the ones in metadata.json
+            if 'zoneMap' in batch:
+                sample.zone_map = ZoneMap.from_json(batch['zoneMap'])
+
+            if 'frequencies' in batch:
+                sample.frequencies = {name: [tuple(entry) for entry in counts] for name, counts in batch['frequencies'].items()}
+
             self.samples.append(sample)            
 
         if self.backend.config.getboolean('backend', 'shuffle'):
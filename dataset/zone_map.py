@@ -0,0 +1,54 @@
+import numpy as np
+
+from .field import QuantitativeField
+
+class ZoneMap:
+    """ the min, max, and null count of each quantitative column in a sample """
+
+    def __init__(self, columns=None, names=()):
+        self.columns = columns or {} # name -> (min, max, null_count), min and max are None if all values are null
+
+        # a lazy zone map gets the zones of names when a scan has read their columns (see fill)
+        self.names = set(names)
+
+    def get(self, name):
+        """ returns None if the zone of name is unknown, e.g., because its column has not been read yet """
+        return self.columns.get(name)
+
+    def fill(self, names, read):
+        """ computes the zones of the lazy columns in names that are still unknown, where read(name) returns a column """
+        for name in names:
+            if name in self.names and name not in self.columns:
+                self.columns[name] = ZoneMap.zone(read(name))
+
+    @staticmethod
+    def zone(values):
+        values = np.asarray(values, dtype=float)
+        null_count = int(np.isnan(values).sum())
+
+        if null_count == len(values):
+            return (None, None, null_count)
+
+        return (float(np.nanmin(values)), float(np.nanmax(values)), null_count)
+
+    @staticmethod
+    def from_frame(df, fields):
+        return ZoneMap({name: ZoneMap.zone(df[name]) for name in ZoneMap.names_of(df, fields)})
+
+    @staticmethod
+    def lazy(df, fields):
+        return ZoneMap(names=ZoneMap.names_of(df, fields))
+
+    @staticmethod
+    def names_of(df, fields):
+        return [field.name for field in fields if isinstance(field, QuantitativeField) and field.name in df.columns]
+
+    @staticmethod
+    def from_json(json):
+        """ reads the "zoneMap" property of a batch in metadata.json """
+        return ZoneMap({name: (column.get('min', None), column.get('max', None), column.get('nullCount', 0))
+            for name, column in json.items()})
+
+    def to_json(self):
+        return {name: {'min': min, 'max': max, 'nullCount': null_count}
+            for name, (min, max, null_count) in self.columns.items()}
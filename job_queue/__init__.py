@@ -1 +1,2 @@
 from .job_queue import *
+from .scheduler import *
@@ -1,88 +1,231 @@
-from functools import cmp_to_key
-from query import JobState
+import heapq
+import itertools
+from collections import deque
+
+class QueryJobs:
+    """ the pending jobs of a single query in the order they are processed """
+
+    def __init__(self, query):
+        self.query = query
+        self.jobs = deque()
+        self.by_sample = {}
+        self.taken = set()
+        self.paused = False
+        self.base = 0
+        self.version = 0
+
+    def __len__(self):
+        return len(self.by_sample)
+
+    def append(self, job):
+        self.jobs.append(job)
+        self.by_sample[id(job.sample)] = job
+
+    def head(self):
+        # skip jobs that were already taken out of order by a shared scan
+        while len(self.jobs) > 0 and self.jobs[0].id in self.taken:
+            self.taken.remove(self.jobs.popleft().id)
+
+        if len(self.jobs) > 0:
+            return self.jobs[0]
+
+        return None
+
+    def appendleft(self, job):
+        self.jobs.appendleft(job)
+        self.by_sample[id(job.sample)] = job
+
+    def popleft(self):
+        job = self.head()
+        self.jobs.popleft()
+        del self.by_sample[id(job.sample)]
+        return job
+
+    def take(self, sample):
+        """ removes and returns the job that targets sample, if any """
+        job = self.by_sample.pop(id(sample), None)
+
+        if job is not None:
+            self.taken.add(job.id)
+
+        return job
+
+class JobQueue:
+    """ per-query job queues with a heap over their heads, so that enqueuing and
+    dequeuing take O(log n) and pausing, resuming, or removing a query O(1) (O(q log q) in alternate mode) """
 
-class JobQueue:    
     def __init__(self):
-        self.queue = []
-            
+        self.queues = {}
+        self.heap = []
+        self.alternate = False
+        self.count = 0
+        self.counter = itertools.count()
+
+    def key(self, queue):
+        query = queue.query
+
+        if self.alternate:
+            # the round (i.e., how many jobs are ahead in the same query) goes first to alternate queries
+            return (query.priority, queue.head().index - queue.base, query.order)
+
+        return (query.priority, query.order)
+
+    def push(self, queue):
+        queue.version += 1
+
+        if not queue.paused and queue.head() is not None:
+            heapq.heappush(self.heap, (self.key(queue), next(self.counter), queue.version, queue))
+
+    def top(self):
+        """ returns the queue with the first runnable job, dropping stale heap entries """
+        while len(self.heap) > 0:
+            _, _, version, queue = self.heap[0]
+
+            if version == queue.version and self.queues.get(queue.query.id) is queue:
+                return queue
+
+            heapq.heappop(self.heap)
+
+        return None
+
     def append(self, jobs):
-        self.queue += jobs
+        touched = []
+
+        for job in jobs:
+            query_id = job.query.id
+
+            if query_id not in self.queues:
+                self.queues[query_id] = QueryJobs(job.query)
+
+            queue = self.queues[query_id]
+            queue.append(job)
+            touched.append(queue)
+
+            self.count += 1
+
+        for queue in set(touched):
+            self.push(queue)
 
     def __len__(self):
-        return len(self.queue)
+        return self.count
 
     def peep(self):
-        if len(self) > 0:
-            return self.queue[0]
+        queue = self.top()
+
+        if queue is not None:
+            return queue.head()
 
         return None
 
     def dequeue(self):
-        if len(self) == 0:
+        queue = self.top()
+
+        if queue is None:
             return None
-        
-        first = self.queue[0]
-        self.queue = self.queue[1:]
 
-        return first
+        heapq.heappop(self.heap)
+        job = queue.popleft()
+        self.count -= 1
 
-    def remove_by_client_socket_id(self, client_socket_id):
-        count = len(self.queue)
-        self.queue = [job for job in self.queue if job.query.client_socket_id != client_socket_id]
-        return count - len(self.queue)
+        if len(queue) > 0:
+            self.push(queue)
+        else:
+            del self.queues[queue.query.id]
 
-    def remove_by_query_id(self, query_id):
-        self.queue = [job for job in self.queue if job.query.id != query_id]
+        return job
 
-    def pause_by_query_id(self, query_id):
-        for job in self.queue:
-            if job.query.id == query_id:
-                job.pause()
+    def requeue(self, jobs):
+        """ puts jobs back at the front of their queries, e.g., the rest of a sample whose first rows were dequeued """
+        touched = []
 
-    def resume_by_query_id(self, query_id):
-        for job in self.queue:
-            if job.query.id == query_id:
-                job.resume()
+        for job in jobs:
+            query_id = job.query.id
 
-    def reschedule(self, alternate):
-        if alternate:
-            def cmp(a, b):
-                if a.query.priority != b.query.priority:
-                    return a.query.priority - b.query.priority 
+            if query_id not in self.queues:
+                self.queues[query_id] = QueryJobs(job.query)
 
-                if a.state != b.state:
-                    if a.state == JobState.Paused:
-                        return 1
-                    return -1
+            queue = self.queues[query_id]
+            queue.appendleft(job)
+            touched.append(queue)
 
-                a_index = a.index - a.query.num_processed_blocks
-                b_index = b.index - b.query.num_processed_blocks
+            self.count += 1
 
-                if a_index != b_index:
-                    return a_index - b_index
+        for queue in set(touched):
+            self.push(queue)
 
-                a_order = a.query.order
-                b_order = b.query.order
+    def dequeue_shared(self):
+        """ dequeues the first job along with all running jobs that target the same sample """
+        first = self.dequeue()
 
-                return a_order - b_order
+        if first is None:
+            return []
 
-            self.queue.sort(key=cmp_to_key(cmp))
-        else:
-            def cmp(a, b):
-                if a.query.priority != b.query.priority:
-                    return a.query.priority - b.query.priority 
+        shared = []
+
+        for queue in list(self.queues.values()):
+            if queue.paused:
+                continue
+
+            head = queue.head()
+            job = queue.take(first.sample)
+
+            if job is None:
+                continue
+
+            shared.append(job)
+            self.count -= 1
 
-                if a.state != b.state:
-                    if a.state == JobState.Paused:
-                        return 1
-                    return -1
+            if len(queue) == 0:
+                del self.queues[queue.query.id]
+            elif job is head:
+                self.push(queue)
 
-                a_order = a.query.order
-                b_order = b.query.order
+        return [first] + shared
 
-                return a_order - b_order
+    def remove_by_client_socket_id(self, client_socket_id):
+        count = len(self)
+
+        for query_id in [query_id for query_id, queue in self.queues.items() if queue.query.client_socket_id == client_socket_id]:
+            self.count -= len(self.queues.pop(query_id))
+
+        self.refresh()
+
+        return count - len(self)
+
+    def remove_by_query_id(self, query_id):
+        queue = self.queues.pop(query_id, None)
+
+        if queue is not None:
+            self.count -= len(queue)
+            self.refresh()
 
-            self.queue.sort(key=cmp_to_key(cmp))
-            
+    def pause_by_query_id(self, query_id):
+        queue = self.queues.get(query_id)
+
+        if queue is not None and not queue.paused:
+            queue.paused = True
+            queue.version += 1
+            self.refresh()
+
+    def resume_by_query_id(self, query_id):
+        queue = self.queues.get(query_id)
 
+        if queue is not None and queue.paused:
+            queue.paused = False
+            self.push(queue)
+            self.refresh()
+
+    def refresh(self):
+        """ rounds are counted from the blocks processed when the queue was last rescheduled, so they are
+        counted again whenever queries are paused, resumed, or removed in alternate mode, as a full sort did """
+        if self.alternate:
+            self.reschedule(self.alternate)
+
+    def reschedule(self, alternate):
+        """ rebuilds the heap after query orders change, which takes O(q log q) for q queries """
+        self.alternate = alternate
+        self.heap = []
 
+        for queue in self.queues.values():
+            queue.base = queue.query.num_processed_blocks
+            self.push(queue)
@@ -0,0 +1,125 @@
+import os
+
+import eventlet
+from eventlet import hubs
+
+class FairScheduler:
+    """ picks the session to run the next jobs from by weighted fair queuing. a session has a virtual time that
+    advances by the estimated cost of the jobs it runs divided by its weight, and the runnable session with the
+    smallest virtual time goes first, so a session with heavy queries does not slow down one with light queries """
+
+    def __init__(self):
+        self.vtimes = {} # session -> virtual time
+        self.running = {} # session -> the number of job batches in flight
+        self.clock = 0 # the virtual time of the last pick
+
+    def runnable(self, session):
+        if session.quota > 0 and self.running.get(session, 0) >= session.quota:
+            return False
+
+        return session.job_queue.peep() is not None
+
+    def pick(self, sessions):
+        """ returns the runnable session with the smallest virtual time, or None """
+        best = None
+
+        for session in sessions:
+            if not self.runnable(session):
+                continue
+
+            # a session that has been idle does not get credit for it
+            vtime = max(self.vtimes.get(session, 0), self.clock)
+
+            if best is None or vtime < best_vtime:
+                best, best_vtime = session, vtime
+
+        if best is not None:
+            self.clock = best_vtime
+            self.vtimes[best] = best_vtime
+
+        return best
+
+    def charge(self, session, jobs):
+        """ accounts for jobs of session that are about to run """
+        self.vtimes[session] = self.vtimes.get(session, self.clock) + sum(job.cost() for job in jobs) / session.weight
+        self.running[session] = self.running.get(session, 0) + 1
+
+    def release(self, session):
+        self.running[session] -= 1
+
+class BlockSizer:
+    """ picks how many rows a job batch processes so that it takes about target seconds,
+    from the throughput measured for each type of job """
+
+    ALPHA = 0.3 # the weight of the latest measurement
+
+    def __init__(self, target, min_rows):
+        self.target = target
+        self.min_rows = min_rows
+        self.throughputs = {} # job type -> rows per second
+
+    def seconds(self, jobs, num_rows):
+        """ returns the estimated time for jobs to process num_rows rows each, or None if a type of job has not been measured """
+        seconds = 0
+
+        for job in jobs:
+            throughput = self.throughputs.get(type(job))
+
+            if throughput is None:
+                return None
+
+            seconds += num_rows / throughput
+
+        return seconds
+
+    def rows(self, jobs, budget):
+        """ returns the number of rows that jobs can process in budget seconds. jobs of an unmeasured type
+        process min_rows rows first so that they are measured without holding up others """
+        seconds = self.seconds(jobs, 1)
+
+        if seconds is None:
+            return self.min_rows
+
+        return max(self.min_rows, int(budget / seconds))
+
+    def measure(self, jobs, elapsed):
+        """ updates the throughputs from the time a job batch took, which is divided among jobs by their costs """
+        cost = sum(job.cost() for job in jobs)
+
+        for job in jobs:
+            if job.cost() == 0 or elapsed <= 0:
+                continue
+
+            throughput = job.sample.num_rows / (elapsed * job.cost() / cost)
+            previous = self.throughputs.get(type(job))
+
+            if previous is not None:
+                throughput = previous * (1 - self.ALPHA) + throughput * self.ALPHA
+
+            self.throughputs[type(job)] = throughput
+
+class Wakeup:
+    """ wakes up a green thread blocked in wait(). set() can be called from any thread, e.g., when a future is done """
+
+    def __init__(self):
+        self.read_fd, self.write_fd = os.pipe()
+        os.set_blocking(self.read_fd, False)
+        os.set_blocking(self.write_fd, False)
+
+    def set(self, *args):
+        try:
+            os.write(self.write_fd, b'\0')
+        except BlockingIOError:
+            pass # the pipe is full, so a wakeup is pending anyway
+
+    def wait(self, timeout=None):
+        try:
+            hubs.trampoline(self.read_fd, read=True, timeout=timeout)
+        except eventlet.Timeout:
+            pass
+
+        try:
+            while os.read(self.read_fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
@@ -3,6 +3,7 @@ import configparser
 import logging
 
 import json
+import time
 
 import socketio
 import eventlet
@@ -10,8 +11,9 @@ import eventlet
 #eventlet.monkey_patch()
 
 from query import *
-from session import Session
-from backend import LocalBackend, SparkBackend
+from session import Session, SessionRegistry
+from job_queue import FairScheduler, BlockSizer, Wakeup
+from backend import LocalBackend, LocalParallelBackend, SparkBackend
 
 import os
 
@@ -31,6 +33,9 @@ config.set('server', 'version', version)
 if config['backend'].get('type', LocalBackend.config_name) == SparkBackend.config_name:
     logging.info('Using a Spark backend')
     backend = SparkBackend(config)
+elif config['backend'].get('type') == LocalParallelBackend.config_name:
+    logging.info('Using a parallel local backend')
+    backend = LocalParallelBackend(config)
 else:
     logging.info('Using a local backend')
     backend = LocalBackend(config)
@@ -44,63 +49,369 @@ sio = socketio.Server(cors_allowed_origins='*')
 app = socketio.WSGIApp(sio)
 sock = eventlet.listen(('', 7999))
 
-sessions = []
+sessions = SessionRegistry()
 test_session = Session()
 test_session.code = 'ABC'
-sessions.append(test_session)
+test_session.weight = config['backend'].getfloat('session_weight', 1)
+test_session.quota = config['backend'].getint('session_quota', 0)
+sessions.add(test_session)
 
 def get_session_by_sid(sid):
-    for ses in sessions:
-        if sid in ses.sids:
-            return ses
-    
-    return None
+    return sessions.get_by_sid(sid)
+
+shared_scan = config['backend'].getboolean('shared_scan', False)
+
+# partial results are reused across queries, as samples never change once loaded
+result_cache = ResultCache(config['backend'].getint('result_cache_size', 4096),
+    config['backend'].getint('result_cache_bytes', 64 * 1024 * 1024))
+
+in_flight = [] # [(session, jobs, future)]
+
+scheduler = FairScheduler()
+
+# jobs are split or merged to finish in about this many milliseconds, or run on whole samples if 0
+target_latency = config['backend'].getint('target_latency', 0)
+
+sizer = None
+if target_latency > 0:
+    sizer = BlockSizer(target_latency / 1000, config['backend'].getint('min_block_rows', 1000))
+
+# wakes up run_queue when a job batch is done or new jobs are queued
+wakeup = Wakeup()
+
+# sid -> {query id: the last version of the result that the client acknowledged}, for clients in the delta mode
+delta_sids = {}
+
+# clients in the delta mode also get the full result of a query every this many versions
+snapshot_every = config['backend'].getint('snapshot_every', 20)
+
+# query id -> the version of the last full snapshot sent to clients in the delta mode
+snapshots = {}
+
+# sids of clients that do not get results, e.g., to only watch the status of safeguards
+status_sids = set()
+
+# sid -> the encoding of results, for clients that did not choose 'json' in REQ/restore
+encodings = {}
+
+result_encodings = ['json', 'columnar']
+
+# updates of a session are batched and flushed every this many milliseconds, or emitted right away if 0
+emit_interval = config['backend'].getint('emit_interval', 0)
+
+def result_jsons(session, query):
+    """ returns {sid: json} of the result of query for the clients of session that get it,
+    or None if every client gets the full result in JSON """
+    delta = any(sid in delta_sids for sid in session.sids)
+    custom = any(sid in encodings or sid in status_sids for sid in session.sids)
+
+    if not delta and not custom:
+        return None
+
+    snapshot = False
+
+    if delta and query.result.version - snapshots.get(query.id, 0) >= snapshot_every:
+        snapshots[query.id] = query.result.version
+        snapshot = True
+
+        if not custom:
+            return None
+
+    # clients that acknowledged the same version with the same encoding share a result
+    jsons = {}
+    shared = {}
+
+    for sid in session.sids:
+        # clients in the status mode only get the status of safeguards
+        if sid in status_sids:
+            continue
+
+        since = delta_sids[sid].get(query.id, 0) if sid in delta_sids and not snapshot else None
+        encoding = encodings.get(sid, 'json')
+
+        if (since, encoding) not in shared:
+            shared[(since, encoding)] = query.to_json(since, encoding)
+
+        jsons[sid] = shared[(since, encoding)]
+
+    return jsons
+
+def emit_result(session, query):
+    if emit_interval > 0:
+        session.outbox.result(query)
+        return
+
+    jsons = result_jsons(session, query)
 
-def run_queue():    
+    if jsons is None:
+        sio.emit('result', {'query': query.to_json()}, room=session.code)
+        return
+
+    for sid, result in jsons.items():
+        sio.emit('result', {'query': result}, to=sid)
+
+def emit_job_start(session, job):
+    if emit_interval > 0:
+        session.outbox.start(job.query, job.sample.num_rows)
+        return
+
+    sio.emit('STATUS/job/start', {'id': job.query.id, 
+        'numOngoingBlocks': 1, 
+        'numOngoingRows': job.sample.num_rows},
+        room=session.code)
+
+def emit_job_end(session, job):
+    if emit_interval > 0:
+        session.outbox.end(job.query)
+        return
+
+    sio.emit('STATUS/job/end', {'id': job.query.id},
+        room=session.code)
+
+def emit_safeguards(session, safeguards):
+    """ sends only the safeguards whose status or confidence changed """
+    if emit_interval > 0:
+        session.outbox.safeguard_changes(safeguards)
+        return
+
+    sio.emit('STATUS/safeguards/changes', safeguards, room=session.code)
+
+def emit_query_states(session):
+    if emit_interval > 0:
+        session.outbox.queries()
+        return
+
+    sio.emit('STATUS/queries', session.query_state_to_json(), room=session.code)
+
+def flush(session):
+    """ emits the updates of session since the last flush as a single 'batch' message of [[name, data], ...] """
+    if len(session.outbox) == 0:
+        return
+
+    events, queries, queries_changed = session.outbox.take()
+    states = [['STATUS/queries', session.query_state_to_json()]] if queries_changed else []
+
+    results = [(query, result_jsons(session, query)) for query in queries]
+
+    if all(jsons is None for _, jsons in results):
+        events += [['result', {'query': query.to_json()}] for query, _ in results]
+        sio.emit('batch', {'events': events + states}, room=session.code)
+        return
+
+    full = {}
+
+    for sid in session.sids:
+        sid_events = events[:]
+
+        for query, jsons in results:
+            if jsons is None:
+                if query.id not in full:
+                    full[query.id] = query.to_json()
+
+                result = full[query.id]
+            elif sid in jsons:
+                result = jsons[sid]
+            else:
+                continue
+
+            sid_events.append(['result', {'query': result}])
+
+        sio.emit('batch', {'events': sid_events + states}, to=sid)
+
+def run_outboxes():
     while True:
+        eventlet.sleep(emit_interval / 1000)
+
         for session in sessions:
-            job_queue = session.job_queue
+            flush(session)
 
-            if len(job_queue) > 0 and job_queue.peep().state == JobState.Running:
-                job = job_queue.dequeue()
-                query = job.query
+def take(session):
+    """ dequeues the next jobs of session, which target the same sample """
+    if shared_scan:
+        return session.job_queue.dequeue_shared()
 
-                sio.emit('STATUS/job/start', {'id': query.id, 
-                    'numOngoingBlocks': 1, 
-                    'numOngoingRows': job.sample.num_rows},
-                    room=session.code)
+    return [session.job_queue.dequeue()]
 
-                res = backend.run(job) # unified format, [[a, 1], [b, 2]]
-                query.accumulate(res)
-                query.num_processed_blocks += 1
-                query.num_processed_rows += job.sample.num_rows
-                query.last_updated = now()
+def resolve(session, jobs):
+    """ completes the jobs whose partial results are known without a scan and returns the others """
+    hits, results, misses = [], [], []
 
-                # eventlet.sleep(1)
+    for job in jobs:
+        if job.skippable():
+            # no row of the sample passes the filter, so the partial result is empty
+            res = []
+        else:
+            res = job.summary()
 
-                sio.emit('STATUS/job/end', {'id': query.id},
-                    room=session.code)
+        if res is None:
+            res = result_cache.get(job)
 
-                sio.emit('result', { 
-                    'query': job.query.to_json()
-                }, room=session.code)
+        if res is None:
+            misses.append(job)
+        else:
+            hits.append(job)
+            results.append(res)
 
-                if query.done():
-                    sio.emit('STATUS/queries', session.query_state_to_json(), room=session.code)
+    # skipped, summarized, and cached partial results are accumulated right away without running their jobs
+    if len(hits) > 0:
+        for job in hits:
+            emit_job_start(session, job)
 
-        eventlet.sleep(0.001)
+        complete(session, hits, results)
+
+    return misses
+
+def fit(session, jobs, budget):
+    """ returns jobs on as many first rows of their sample as they can process in budget seconds,
+    and puts jobs on the rest of the sample back in the queue """
+    sample = jobs[0].sample
+    rows = sizer.rows(jobs, budget)
+
+    if rows >= sample.num_rows or not getattr(sample, 'splittable', False):
+        return jobs
+
+    rest = sample.slice(rows, sample.num_rows)
+    session.job_queue.requeue([job.on(rest) for job in jobs])
+
+    head = sample.slice(0, rows)
+    return [job.on(head) for job in jobs]
+
+def dispatch(session):
+    job_queue = session.job_queue
+    batch = []
+    budget = sizer.target if sizer is not None else 0
+
+    while True:
+        misses = resolve(session, take(session))
+
+        if sizer is None or len(misses) == 0:
+            batch += misses
+            break
+
+        misses = fit(session, misses, budget)
+        batch += misses
+
+        seconds = sizer.seconds(misses, misses[0].sample.num_rows)
+        budget -= seconds if seconds is not None else budget
+
+        # jobs on small samples are merged into one batch while the batch is estimated to finish within the target
+        next_job = job_queue.peep()
+
+        if next_job is None:
+            break
+
+        seconds = sizer.seconds([next_job], next_job.sample.num_rows)
+
+        if seconds is None or seconds > budget:
+            break
+
+    if len(batch) > 0:
+        for job in batch:
+            emit_job_start(session, job)
+
+        scheduler.charge(session, batch)
+
+        future = backend.submit(batch, pool=session.code)
+        future.add_done_callback(wakeup.set)
+        in_flight.append((session, batch, future, time.perf_counter()))
+
+def complete(session, jobs, results):
+    queries = []
+
+    for job, res in zip(jobs, results): # unified format, [[a, 1], [b, 2]]
+        query = job.query
+
+        emit_job_end(session, job)
+
+        # jobs that were running when their query converged do not change the result
+        if query.state == QueryState.Converged:
+            continue
+
+        query.accumulate(res)
+        block_done = query.processed(job.sample)
+        query.last_updated = now()
+
+        if block_done and query.stop_when is not None and not query.done() and query.stop_when.converged(query):
+            # the estimates are good enough, so the rest of the blocks are not processed
+            query.converge()
+            session.job_queue.remove_by_query_id(query.id)
+
+        if query not in queries:
+            queries.append(query)
+
+    # a batch can have several jobs of a query, whose results are sent once
+    safeguards = {}
+
+    for query in queries:
+        emit_result(session, query)
+        safeguards.update(session.evaluate_safeguards(query))
+
+        if query.done():
+            emit_query_states(session)
+
+    if len(safeguards) > 0:
+        emit_safeguards(session, safeguards)
+
+def collect():
+    for entry in [entry for entry in in_flight if entry[2].done()]:
+        in_flight.remove(entry)
+
+        session, jobs, future, started = entry
+        results = future.result()
+
+        scheduler.release(session)
+
+        if sizer is not None:
+            sizer.measure(jobs, time.perf_counter() - started)
+
+        for job, res in zip(jobs, results):
+            result_cache.put(job, res)
+
+        complete(session, jobs, results)
+
+def run_queue():
+    while True:
+        collect()
+
+        while len(in_flight) < backend.max_in_flight:
+            session = scheduler.pick(sessions)
+
+            if session is None:
+                break
+
+            dispatch(session)
+
+            # skipped and cached jobs are completed without waiting, so let socket events through
+            eventlet.sleep(0)
+            collect()
+
+        # sleep until a job batch is done or new jobs are queued
+        wakeup.wait()
 
 forever = eventlet.spawn(run_queue)
 
+if emit_interval > 0:
+    eventlet.spawn(run_outboxes)
+
 @sio.on('connect')
 def connect(sid, environ):
-    sio.emit('welcome', backend.get_welcome(), to=sid)
+    welcome = backend.get_welcome()
+    welcome['resultCache'] = result_cache.stats()
+    welcome['resultModes'] = ['full', 'delta', 'status']
+    welcome['resultEncodings'] = result_encodings
+
+    sio.emit('welcome', welcome, to=sid)
 
 @sio.on('disconnect')
 def disconnect(sid):
-    for ses in sessions:
-        ses.leave_sid(sid)
-        sio.leave_room(sid, ses.code)
+    delta_sids.pop(sid, None)
+    status_sids.discard(sid)
+    encodings.pop(sid, None)
+
+    session = sessions.leave(sid)
+
+    if session is not None:
+        sio.leave_room(sid, session.code)
 
     # removed_jobs = job_queue.remove_by_client_socket_id(sid)
     # print(sid, 'disconnected')
@@ -110,17 +421,23 @@ def disconnect(sid):
 def restore(sid, data):
     code = data['code'].upper()
     print('Session Restored', code)
+
+    # 'columnar' sends results as typed arrays in binary attachments instead of lists of rows
+    encoding = data.get('encoding', 'json')
+
+    if encoding not in result_encodings:
+        encoding = 'json'
     
-    session = list(filter(lambda x: x.code == code, sessions))
-    if len(session) == 0:
+    session = sessions.get(code)
+    if session is None:
         sio.emit('RES/restore', {
             'success': False
         }, to=sid)
     else:
-        session = session[0]
         print('restore session', sid, session.to_json())
         sio.emit('RES/restore', {
             'success': True,
+            'encoding': encoding,
             'session': session.to_json(),
             'metadata': {
                 'name': dataset.name,
@@ -130,24 +447,53 @@ def restore(sid, data):
             }
         }, to=sid)
 
-        for ses in sessions:
-            ses.leave_sid(sid)
-            sio.leave_room(sid, ses.code)
+        if encoding == 'json':
+            encodings.pop(sid, None)
+        else:
+            encodings[sid] = encoding
+
+        left = sessions.enter(sid, session)
+
+        if left is not None:
+            sio.leave_room(sid, left.code)
 
-        session.enter_sid(sid)
         sio.enter_room(sid, session.code)
 
+@sio.on('REQ/result/mode')
+def result_mode(sid, data):
+    """ 'full' (the default) sends the whole result of a query after every block,
+    'delta' sends only the groups that changed since the version the client acknowledged last,
+    and 'status' sends no results but only the changes of safeguards """
+    mode = data.get('mode', 'full')
+
+    if mode == 'delta':
+        delta_sids.setdefault(sid, {})
+        status_sids.discard(sid)
+    elif mode == 'status':
+        delta_sids.pop(sid, None)
+        status_sids.add(sid)
+    else:
+        mode = 'full'
+        delta_sids.pop(sid, None)
+        status_sids.discard(sid)
+
+    sio.emit('RES/result/mode', {'mode': mode, 'snapshotEvery': snapshot_every}, to=sid)
+
+@sio.on('REQ/result/ack')
+def result_ack(sid, data):
+    if sid in delta_sids:
+        delta_sids[sid][data['query']['id']] = data['version']
+
 @sio.on('REQ/login')
 def login(sid, data):
     code = data['code'].upper()
     
-    session = list(filter(lambda x: x.code == code, sessions))
-    if len(session) == 0:
+    session = sessions.get(code)
+    if session is None:
         sio.emit('RES/login', {
             'success': False
         }, to=sid)
     else:
-        session = session[0]
         sio.emit('RES/login', {
             'success': True,
             'code': session.code
@@ -165,6 +511,7 @@ def query(sid, data):
     query = Query.from_json(query_json, dataset)
 
     session.add_query(query)
+    wakeup.set()
 
     sio.emit('RES/query', {'query': query.to_json() }, room=session.code)
     sio.emit('STATUS/queries', session.query_state_to_json(), room=session.code)
@@ -209,6 +556,7 @@ def query_resume(sid, data):
     
     if session.get_query(query_id) is not None:
         session.resume_query(session.get_query(query_id))
+        wakeup.set()
 
     sio.emit('STATUS/queries', session.query_state_to_json(), room=session.code)        
 
@@ -235,6 +583,7 @@ def query_reorder(sid, data):
 
     session.reorder(order)
     session.reschedule()
+    wakeup.set()
     sio.emit('STATUS/queries', session.query_state_to_json(), room=session.code)
 
 @sio.on('REQ/queue/reschedule')
@@ -247,7 +596,11 @@ def queue_reschedule(sid, data):
         alternate = data['alternate']
         session.alternate = alternate
 
+    if 'weight' in data and data['weight'] > 0:
+        session.weight = data['weight']
+
     session.reschedule()
+    wakeup.set()
     sio.emit('STATUS/queries', session.query_state_to_json(), room=session.code)
 
 @sio.on('REQ/safeguard/remove')
@@ -1,3 +1,8 @@
 from .query import *
 from .job import *
-from .predicate import *
\ No newline at end of file
+from .predicate import *
+from .scan import *
+from .result_cache import *
+from .stopping import *
+from .estimate import *
+from .safeguard import *
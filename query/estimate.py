@@ -0,0 +1,73 @@
+import json
+import math
+
+import numpy as np
+
+from accum import GroupedAggregates, BinnedCounts
+
+def key_id(key):
+    """ returns a string that is equal for a key of a result and the same key in JSON """
+    if isinstance(key, float) and math.isnan(key):
+        key = None
+    elif isinstance(key, (list, tuple)):
+        key = [None if isinstance(x, float) and math.isnan(x) else x for x in key]
+
+    return json.dumps(key, default=str)
+
+class Estimates:
+    """ the estimates of the groups of a query with their standard errors, which are the means of groups
+    for aggregates (except count) and the proportions of groups otherwise """
+
+    def __init__(self, query):
+        result = query.result
+        self.means = isinstance(result, GroupedAggregates) and query.aggregate != 'count'
+
+        if self.means:
+            keys, stats = result.columns()
+
+            # groups that only have nulls have no mean
+            present = stats[:, GroupedAggregates.COUNT] > 0
+            keys = [key for key, p in zip(keys, present.tolist()) if p]
+            stats = stats[present]
+            count = stats[:, GroupedAggregates.COUNT]
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values = stats[:, GroupedAggregates.SUM] / count
+                variance = np.maximum(stats[:, GroupedAggregates.SSUM] / count - values ** 2, 0) * count / (count - 1)
+                errors = np.sqrt(variance / count)
+
+            # a group with less than two values has no variance to estimate
+            errors[count < 2] = np.inf
+        else:
+            if isinstance(result, GroupedAggregates):
+                keys, stats = result.columns()
+                counts = stats[:, GroupedAggregates.COUNT]
+            else:
+                keys, counts = result.columns()
+
+            if isinstance(result, BinnedCounts):
+                keys = [tuple(None if i < 0 else i for i in row) for row in keys.tolist()]
+                keys = [key[0] if len(key) == 1 else key for key in keys]
+
+            total = max(counts.sum(), 1)
+            values = counts / total
+            errors = np.sqrt(values * (1 - values) / total)
+
+        # blocks are sampled without replacement, so the errors shrink to zero as the whole dataset is processed
+        correction = math.sqrt(max(0, 1 - query.num_processed_rows / query.dataset.num_rows))
+        errors = errors * correction if correction > 0 else np.zeros_like(errors)
+
+        self.keys = keys
+        self.values = values
+        self.errors = errors
+        self.index = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def find(self, key):
+        """ returns the position of key (e.g., from JSON), or None if the group has not been seen """
+        if self.index is None:
+            self.index = {key_id(k): i for i, k in enumerate(self.keys)}
+
+        return self.index.get(key_id(key))
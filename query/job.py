@@ -1,11 +1,23 @@
 from accum import *
+from . import kernel
+from .scan import SampleScan
 from enum import Enum
-import pandas as pd
+import copy
+import json
 import numpy as np
 
 MAX_VALUE = float('inf')
-EMPTY_MAGIC_STRING = 'NANANA'
-EMPTY_KEY = -999
+
+def spark_bin(name, bin_spec):
+    """ returns a Spark column of the bin indices of the values of name, clamped to the bins, with nulls kept as nulls """
+    from pyspark.sql import functions as F
+
+    value = F.col(name)
+    index = F.floor((value - F.lit(bin_spec.start)) / F.lit(bin_spec.step())).cast('int')
+
+    # greatest and least skip nulls, so nulls must be kept explicitly
+    return F.when(value.isNull(), F.lit(None)) \
+        .otherwise(F.greatest(F.lit(0), F.least(F.lit(bin_spec.num_bins - 1), index)))
 
 class JobState(Enum):
     Running = 'Running'
@@ -13,6 +25,7 @@ class JobState(Enum):
 
 class Job:
     id = 1
+    num_columns = 1 # the number of columns that the job reads besides the filter
 
     def __init__(self, index):
         self.id = Job.id
@@ -29,6 +42,47 @@ class Job:
     def to_json(self):
         return {'id': self.id}
 
+    def on(self, sample):
+        """ returns a copy of the job that targets sample instead, e.g., a slice of its sample """
+        job = copy.copy(self)
+        job.id = Job.id
+        job.sample = sample
+        Job.id += 1
+
+        return job
+
+    def cost(self):
+        """ returns the estimated cost of running the job, the number of values it reads """
+        return self.sample.num_rows * (self.num_columns + int(self.where is not None))
+
+    def skippable(self):
+        """ returns True if the zone map of the sample proves that no row passes the filter """
+        zone_map = self.sample.zone_map
+
+        return self.where is not None and zone_map is not None and self.where.is_empty(zone_map)
+
+    def summary(self):
+        """ returns the partial result from the precomputed summaries of the sample, or None if it needs a scan """
+        return None
+
+    def parameters(self):
+        """ returns what determines the partial result besides the sample and the filter, or None if the result must not be reused """
+        return None
+
+    def signature(self):
+        """ returns a key that is equal for jobs that compute the same partial result, or None """
+        parameters = self.parameters()
+
+        if parameters is None:
+            return None
+
+        where = self.where.to_key() if self.where is not None else None
+
+        # a slice of a sample has its row range
+        rows = [self.sample.start, self.sample.end] if hasattr(self.sample, 'parent') else None
+
+        return json.dumps([type(self).__name__, self.sample.index, rows, where] + parameters)
+
 class SelectJob(Job):
     def __init__(self, index, sample, where, query, dataset, limit=100):
         super().__init__(index)
@@ -58,6 +112,8 @@ class SelectJob(Job):
         return {'id': self.id, 'numRows': self.sample.num_rows}
 
 class AggregateJob(Job):
+    num_columns = 2
+
     def __init__(self, index, sample, target, grouping, where, query, dataset):
         super().__init__(index)
 
@@ -74,71 +130,56 @@ class AggregateJob(Job):
         if self.where is not None:
             df = df.filter(self.where.to_sql())
 
-        target_name = self.target.name
-        grouping_name = self.grouping.name
+        from pyspark.sql import functions as F
 
-        # no null value
-        # (sum, ssum, count, min, max)
-        def create_combiner(value):
-            return (value, value * value, 1, value, value)
-        
-        def merge_value(x, value):
-            sum, ssum, count, xmin, xmax = x
-            return (sum + value, \
-                ssum + value * value, \
-                count + 1, \
-                min(xmin, value), \
-                max(xmax, value))
-        
-        def merge_combiner(x, y):
-            return (x[0] + y[0], x[1] + y[1], x[2] + y[2], min(x[3], y[3]), max(x[4], y[4]))
+        target = F.col(self.target.name).cast('double')
 
-        rdd = df.rdd.map(lambda row: (row[grouping_name], row[target_name]))
+        # one pass in Catalyst, with zeros instead of the nulls that sum returns for groups with only nulls
+        rows = df.groupBy(self.grouping.name).agg(
+            F.coalesce(F.sum(target), F.lit(0.0)),
+            F.coalesce(F.sum(target * target), F.lit(0.0)),
+            F.count(target),
+            F.min(target),
+            F.max(target),
+            F.sum(F.when(target.isNull(), 1).otherwise(0))
+        ).collect()
 
-        result = rdd.filter(lambda pair: pair[1] is not None) \
-                .combineByKey(create_combiner, merge_value, merge_combiner) \
-                .collectAsMap()
+        return [tuple(row) for row in rows]
 
-        null_counts = rdd.filter(lambda pair: pair[1] is None) \
-                .countByKey()
 
-        result_keys = set(result.keys())
-        null_count_keys = set(null_counts.keys())
+    def run(self, scan=None):
+        """ returns [('A', sum, ssum, count, min, max, null_count), ...]"""
 
-        for key in result_keys:
-            if key in null_counts:
-                result[key] = result[key] + (0, )
-            else:
-                result[key] = result[key] + (null_counts[key], )
-        
-        for key in null_count_keys - result_keys:
-            result[key] = (0, 0, 0, 0, 0, null_counts[key])
-        
-        return [(key, ) + res for key, res in result.items()]
+        scan = scan or SampleScan(self.sample)
 
+        codes, keys = scan.codes(self.grouping, self.where)
+        values = scan.column(self.target.name, self.where)
 
-    def run(self):
-        """ returns [['A', 10], ['B', 20]]"""
-
-        df = self.sample.df
+        counts = kernel.aggregate_codes(codes, keys, values)
 
-        if self.where is not None:
-            df = df[df.apply(self.where.to_lambda(), axis=1)]
-
-        counts = df.groupby(self.grouping.name)[self.target.name].agg([
-            ('sum', 'sum'),
-            ('ssum', lambda x: np.sum(np.array(x) ** 2)),
-            ('count', lambda x: len([y for y in x if pd.notnull(y)])),
-            ('min', 'min'),
-            ('max', 'max'),
-            ('null_count', lambda x: len([y for y in x if not pd.notnull(y)])),
-        ])
-        
-        counts = [[index, float(row['sum']), float(row['ssum']), float(row['count']),
-         float(row['min']), float(row['max']), float(row['null_count'])] for index, row in counts.iterrows()]
-            
         return counts
 
+    def summary(self):
+        frequencies = self.sample.frequencies
+        zone_map = self.sample.zone_map
+
+        if self.where is not None or self.query.aggregate != 'count' or frequencies is None or zone_map is None:
+            return None
+
+        # the counts of groups equal their frequencies only if no value of the target is null
+        zone = zone_map.get(self.target.name)
+
+        if self.grouping.name not in frequencies or zone is None or zone[2] > 0:
+            return None
+
+        # only the counts are shown, so sum and ssum are left as zeros like in Frequency1DQuery,
+        # and min and max are NaN so that they do not hide the min and max of scanned samples
+        return [(key, 0.0, 0.0, float(count), np.nan, np.nan, 0.0)
+            for key, count in frequencies[self.grouping.name] if key is not None]
+
+    def parameters(self):
+        return [self.target.name, self.grouping.name]
+
     def to_json(self):
         return {'id': self.id, 'numRows': self.sample.num_rows}
 
@@ -154,54 +195,36 @@ class Histogram1DJob(Job):
         self.query = query
         self.dataset = dataset
     
-    def run_spark(self, spark):        
-        bin_start = self.bin_spec.start
-        bin_step = self.bin_spec.step()
-        num_bins = self.bin_spec.num_bins
-
-        def mapper(value):
-            if value[0] is None:
-                return (None, )
-
-            x = int((value[0] - bin_start) // bin_step)
-            return (max(min(x, num_bins - 1), 0), )
-        
-        grouping_name = self.grouping.name
-
+    def run_spark(self, spark):
         df = self.sample.df
+
         if self.where is not None:
             df = df.filter(self.where.to_sql())
 
-        rdd = df.rdd.map(lambda row: (row[grouping_name], ))
+        rows = df.groupBy(spark_bin(self.grouping.name, self.bin_spec).alias('bin')).count().collect()
 
-        counts = list(rdd.map(mapper).countByKey().items())
+        counts = [(row[0], row[1]) for row in rows]
 
         return counts
 
-    def run(self):
-        bin_start = self.bin_spec.start
-        bin_step = self.bin_spec.step()
-        num_bins = self.bin_spec.num_bins
-        grouping_name = self.grouping.name
-        
-        df = self.sample.df
+    def run(self, scan=None):
+        scan = scan or SampleScan(self.sample)
 
-        if self.where is not None:
-            df = df[df.apply(self.where.to_lambda(), axis=1)]
-                
-        bins = self.bin_spec.range()
-        bins[0]-=1
+        indices = scan.bin_indices(self.grouping.name, self.bin_spec, self.where)
 
-        counts = pd.cut(df[grouping_name], bins=bins, labels=list(range(num_bins)))
-        counts = counts.value_counts()
-        counts = [[index, count] for index, count in counts.items()]        
+        counts = kernel.histogram1d(indices, self.bin_spec.num_bins)
 
         return counts
         
+    def parameters(self):
+        return [self.grouping.name, self.bin_spec.start, self.bin_spec.end, self.bin_spec.num_bins]
+
     def to_json(self):
         return {'id': self.id, 'numRows': self.sample.num_rows}
 
 class Histogram2DJob(Job):
+    num_columns = 2
+
     def __init__(self, index, sample, grouping1, bin_spec1, grouping2, bin_spec2, where, query, dataset):
         super().__init__(index)
 
@@ -215,74 +238,33 @@ class Histogram2DJob(Job):
         self.dataset = dataset
     
     def run_spark(self, spark):
-        bin_start1 = self.bin_spec1.start
-        bin_step1 = self.bin_spec1.step()
-        num_bins1 = self.bin_spec1.num_bins
-
-        bin_start2 = self.bin_spec2.start
-        bin_step2 = self.bin_spec2.step()
-        num_bins2 = self.bin_spec2.num_bins
-
-        def mapper(value):
-            if value[0][0] is None:
-                x = (None, )
-            else:
-                x = int((value[0][0] - bin_start1) // bin_step1)
-                x = max(min(x, num_bins1 - 1), 0)
-
-            if value[0][1] is None:
-                y = (None, )
-            else:
-                y = int((value[0][1] - bin_start2) // bin_step2)
-                y = max(min(y, num_bins2 - 1), 0)
-
-            return ((x, y), )
+        df = self.sample.df
 
-        grouping_name1 = self.grouping1.name
-        grouping_name2 = self.grouping2.name
+        if self.where is not None:
+            df = df.filter(self.where.to_sql())
 
-        df = self.sample.df
-        rdd = df.rdd.map(lambda row: ((row[grouping_name1], row[grouping_name2]),))
+        rows = df.groupBy(spark_bin(self.grouping1.name, self.bin_spec1).alias('bin1'),
+            spark_bin(self.grouping2.name, self.bin_spec2).alias('bin2')).count().collect()
 
-        # print('count starts')
-        counts = list(rdd.map(mapper).countByKey().items())
+        counts = [((row[0], row[1]), row[2]) for row in rows]
 
         return counts
 
-    def run(self):
-        bin_start1 = self.bin_spec1.start
-        bin_step1 = self.bin_spec1.step()
-        num_bins1 = self.bin_spec1.num_bins
-        
-        bin_start2 = self.bin_spec2.start
-        bin_step2 = self.bin_spec2.step()
-        num_bins2 = self.bin_spec2.num_bins
-
-        grouping1_name = self.grouping1.name
-        grouping2_name = self.grouping2.name
-        
-        df = self.sample.df
+    def run(self, scan=None):
+        scan = scan or SampleScan(self.sample)
 
-        if self.where is not None:
-            df = df[df.apply(self.where.to_lambda(), axis=1)]
-                
-        bins1 = self.bin_spec1.range()
-        bins2 = self.bin_spec2.range()
+        indices1 = scan.bin_indices(self.grouping1.name, self.bin_spec1, self.where)
+        indices2 = scan.bin_indices(self.grouping2.name, self.bin_spec2, self.where)
 
-        bins1[0]-=1
-        bins2[0]-=1
-        
-        df = df.assign(
-            x_group=pd.cut(df[grouping1_name], bins=bins1, labels=list(range(num_bins1))),
-            y_group=pd.cut(df[grouping2_name], bins=bins2, labels=list(range(num_bins2)))
-        )
-        
-        df = df.assign(xy_key=pd.Categorical(df.filter(items=['x_group', 'y_group']).apply(tuple, 1)))
+        counts = kernel.histogram2d(indices1, self.bin_spec1.num_bins,
+            indices2, self.bin_spec2.num_bins)
 
-        counts = df.groupby('xy_key').size()
-        counts = [[index, count] for index, count in counts.items()]        
         return counts
 
+    def parameters(self):
+        return [self.grouping1.name, self.bin_spec1.start, self.bin_spec1.end, self.bin_spec1.num_bins,
+            self.grouping2.name, self.bin_spec2.start, self.bin_spec2.end, self.bin_spec2.num_bins]
+
     def to_json(self):
         return {'id': self.id, 'numRows': self.sample.num_rows}
 
@@ -305,27 +287,35 @@ class Frequency1DJob(Job):
         counts = df.groupBy(self.grouping.name).count().collect()
         return counts
 
-    def run(self):
+    def run(self, scan=None):
         """ returns [['A', 10], ['B', 20]]"""
 
-        df = self.sample.df
-        grouping = self.grouping.name
+        scan = scan or SampleScan(self.sample)
 
-        if self.where is not None:
-            df = df[df.apply(self.where.to_lambda(), axis=1)]
-        
-        df.loc[:, grouping] = df[grouping].fillna(EMPTY_MAGIC_STRING)
+        codes, keys = scan.codes(self.grouping, self.where)
+
+        counts = kernel.frequency1d(codes, keys)
 
-        counts = df.groupby(self.grouping.name).size()
-        
-        counts = [[index if index != EMPTY_MAGIC_STRING else np.nan, count] for index, count in counts.items()]
         return counts
         
+    def summary(self):
+        frequencies = self.sample.frequencies
+
+        if self.where is not None or frequencies is None:
+            return None
+
+        return frequencies.get(self.grouping.name)
+
+    def parameters(self):
+        return [self.grouping.name]
+
     def to_json(self):
         return {'id': self.id, 'numRows': self.sample.num_rows}
 
 
 class Frequency2DJob(Job):
+    num_columns = 2
+
     def __init__(self, index, sample, grouping1, grouping2, where, query, dataset):
         super().__init__(index)
 
@@ -346,17 +336,20 @@ class Frequency2DJob(Job):
 
         return counts
 
-    def run(self):
+    def run(self, scan=None):
         """ returns [['A', 10], ['B', 20]]"""
 
-        df = self.sample.df
+        scan = scan or SampleScan(self.sample)
 
-        if self.where is not None:
-            df = df[df.apply(self.where.to_lambda(), axis=1)]
+        codes1, keys1 = scan.codes(self.grouping1, self.where)
+        codes2, keys2 = scan.codes(self.grouping2, self.where)
+
+        counts = kernel.frequency2d(codes1, keys1, codes2, keys2)
 
-        counts = df.groupby([self.grouping1.name, self.grouping2.name]).size()
-        counts = [[index, count] for index, count in counts.items()]        
         return counts
 
+    def parameters(self):
+        return [self.grouping1.name, self.grouping2.name]
+
     def to_json(self):
         return {'id': self.id, 'numRows': self.sample.num_rows}
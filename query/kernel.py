@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+
+from dataset import NULL_CODE
+
+def group_starts(codes):
+    """ returns the offsets at which each run of equal (sorted) codes begins """
+    return np.flatnonzero(np.concatenate(([True], codes[1:] != codes[:-1])))
+
+# dictionary codes up to this size are counted directly instead of being factorized
+MAX_DENSE_CODES = 1 << 16
+
+def factorize(groups):
+    """ returns (codes, keys) where nulls have the code -1 """
+    codes, keys = pd.factorize(groups)
+    return codes, keys.tolist()
+
+def factorize_codes(codes):
+    """ renumbers non-negative codes from 0, returns (local codes, original codes) """
+    local = np.full(len(codes), -1, dtype=np.intp)
+    has_code = codes >= 0
+
+    local[has_code], present = pd.factorize(codes[has_code])
+    return local, present
+
+def take(keys, indices):
+    """ returns the keys at indices, where keys are either a list of labels or an array of dictionary codes """
+    if isinstance(keys, np.ndarray):
+        return keys[indices]
+
+    return [keys[i] for i in indices.tolist()]
+
+def aggregate_codes(codes, keys, values):
+    """ computes (sum, ssum, count, min, max, null_count) of values for each
+    distinct non-null group in one pass, returns (groups, an array of the six statistics for each group) """
+
+    values = np.asarray(values, dtype=float)
+
+    # rows with a null group are dropped as in df.groupby
+    has_group = codes >= 0
+    codes = codes[has_group]
+    values = values[has_group]
+
+    num_groups = len(keys)
+    nulls = np.isnan(values)
+
+    null_counts = np.bincount(codes[nulls], minlength=num_groups)
+
+    codes = codes[~nulls]
+    values = values[~nulls]
+
+    sums = np.bincount(codes, weights=values, minlength=num_groups)
+    ssums = np.bincount(codes, weights=values * values, minlength=num_groups)
+    counts = np.bincount(codes, minlength=num_groups)
+
+    # groups without a non-null value have no min and max
+    mins = np.full(num_groups, np.nan)
+    maxs = np.full(num_groups, np.nan)
+
+    if len(codes) > 0:
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        sorted_values = values[order]
+        starts = group_starts(sorted_codes)
+        present = sorted_codes[starts]
+
+        mins[present] = np.minimum.reduceat(sorted_values, starts)
+        maxs[present] = np.maximum.reduceat(sorted_values, starts)
+
+    # keys that do not occur in this sample have nothing to report
+    present = np.flatnonzero((counts + null_counts) > 0)
+
+    stats = np.column_stack([np.asarray(column, dtype=float)[present]
+        for column in (sums, ssums, counts, mins, maxs, null_counts)])
+
+    return take(keys, present), stats
+
+def frequency1d(codes, keys):
+    """ returns (keys, counts) with None (or NULL_CODE for codes) as the key of nulls """
+
+    counts = np.bincount(codes + 1, minlength=len(keys) + 1)
+    present = np.flatnonzero(counts)
+
+    if isinstance(keys, np.ndarray):
+        # keys are codes, so nulls are already -1
+        present_keys = np.append(NULL_CODE, keys)[present]
+    else:
+        present_keys = [keys[i - 1] if i > 0 else None for i in present.tolist()]
+
+    return present_keys, counts[present]
+
+def frequency2d(codes1, keys1, codes2, keys2):
+    """ returns ((keys1, keys2), counts) for rows where neither key is null """
+
+    width = len(keys2)
+
+    both = (codes1 >= 0) & (codes2 >= 0)
+    pairs = codes1[both].astype(np.int64) * width + codes2[both]
+    pairs, counts = np.unique(pairs, return_counts=True)
+
+    return (take(keys1, pairs // width), take(keys2, pairs % width)), counts
+
+def bin_indices(values, bin_spec):
+    """ returns bin indices clamped to [0, num_bins - 1], with nulls in bin num_bins.
+    bins are closed on the left, [start + i * step, start + (i + 1) * step), so a value on an edge goes to the bin that it starts """
+
+    values = np.asarray(values, dtype=float)
+    nulls = np.isnan(values)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        indices = np.floor((values - bin_spec.start) / bin_spec.step())
+
+    indices = np.clip(indices, 0, bin_spec.num_bins - 1)
+    indices[nulls] = bin_spec.num_bins
+
+    return indices.astype(np.intp)
+
+def histogram1d(indices, num_bins):
+    """ returns the counts of bins as an array of num_bins + 1, whose last bin holds nulls """
+
+    return np.bincount(indices, minlength=num_bins + 1)
+
+def histogram2d(indices1, num_bins1, indices2, num_bins2):
+    """ returns the counts of bins as a (num_bins1 + 1) x (num_bins2 + 1) array, whose last row and column hold nulls """
+
+    width = num_bins2 + 1
+    counts = np.bincount(indices1 * width + indices2, minlength=(num_bins1 + 1) * width)
+
+    return counts.reshape(num_bins1 + 1, width)
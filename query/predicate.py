@@ -1,3 +1,7 @@
+import json
+
+import numpy as np
+
 from dataset import DataType
 
 class Predicate:
@@ -25,6 +29,51 @@ class Predicate:
 
         return None
 
+    def is_empty(self, zone_map):
+        """ returns True if the zone map of a sample proves that no row satisfies the predicate """
+        return False
+
+    def to_bitmap(self, bitmap_index):
+        """ returns the bitmap of rows that satisfy the predicate, or None if the index cannot answer it """
+        return None
+
+    def to_rows(self, bitmap_index, df):
+        """ returns the sorted ids of rows that satisfy the predicate using a bitmap index, or None """
+        bitmap = self.to_bitmap(bitmap_index)
+
+        if bitmap is None:
+            return None
+
+        return bitmap.to_rows()
+
+    def filter_rows(self, df, rows):
+        """ returns the subset of rows that satisfy the predicate """
+        return rows[self.to_mask(df)[rows]]
+
+    @staticmethod
+    def equal_mask(field, expected, values):
+        dictionary = getattr(field, 'dictionary', None)
+
+        if dictionary is None:
+            return np.asarray(values == expected, dtype=bool)
+
+        # the column holds codes, and a label that was never seen cannot match
+        code = dictionary.code(expected)
+
+        if code is None:
+            return np.zeros(len(values), dtype=bool)
+
+        return np.asarray(values) == code
+
+    @staticmethod
+    def equal_bitmap(field, expected, bitmap_index):
+        dictionary = getattr(field, 'dictionary', None)
+
+        if dictionary is None or not bitmap_index.has(field.name):
+            return None
+
+        return bitmap_index.get(field.name, dictionary.code(expected))
+
 class NumericEqualPredicate(Predicate):
     def __init__(self, field, expected):
         self.field = field
@@ -43,6 +92,28 @@ class NumericEqualPredicate(Predicate):
     def to_lambda(self):
         return lambda x: x[self.field.name] == self.expected
 
+    def to_key(self):
+        return json.dumps(['Equal', self.field.name, self.expected])
+
+    def is_empty(self, zone_map):
+        zone = zone_map.get(self.field.name)
+
+        if zone is None:
+            return False
+
+        min, max, _ = zone
+
+        return min is None or self.expected < min or self.expected > max
+
+    def to_mask(self, df):
+        return Predicate.equal_mask(self.field, self.expected, df[self.field.name])
+
+    def filter_rows(self, df, rows):
+        return rows[Predicate.equal_mask(self.field, self.expected, np.asarray(df[self.field.name])[rows])]
+
+    def to_bitmap(self, bitmap_index):
+        return Predicate.equal_bitmap(self.field, self.expected, bitmap_index)
+
 class StringEqualPredicate(Predicate):
     def __init__(self, field, expected):
         self.field = field
@@ -61,6 +132,18 @@ class StringEqualPredicate(Predicate):
     def to_lambda(self):
         return lambda x: x[self.field.name] == self.expected
 
+    def to_key(self):
+        return json.dumps(['Equal', self.field.name, self.expected])
+
+    def to_mask(self, df):
+        return Predicate.equal_mask(self.field, self.expected, df[self.field.name])
+
+    def filter_rows(self, df, rows):
+        return rows[Predicate.equal_mask(self.field, self.expected, np.asarray(df[self.field.name])[rows])]
+
+    def to_bitmap(self, bitmap_index):
+        return Predicate.equal_bitmap(self.field, self.expected, bitmap_index)
+
 class RangePredicate(Predicate):
     def __init__(self, field, start, end, include_end):
         self.field = field
@@ -84,12 +167,49 @@ class RangePredicate(Predicate):
             'includeEnd': self.include_end
         }
 
+    def to_key(self):
+        return json.dumps(['Range', self.field.name, self.start, self.end, self.include_end])
+
     def to_lambda(self):
         if self.include_end:
             return lambda x: self.start <= x[self.field.name] and x[self.field.name] <= self.end
 
         return lambda x: self.start <= x[self.field.name] and x[self.field.name] < self.end
 
+    def is_empty(self, zone_map):
+        zone = zone_map.get(self.field.name)
+
+        if zone is None:
+            return False
+
+        min, max, _ = zone
+
+        if min is None or max < self.start:
+            return True
+
+        if self.include_end:
+            return min > self.end
+
+        return min >= self.end
+
+    def to_mask(self, df):
+        return self.values_mask(np.asarray(df[self.field.name], dtype=float))
+
+    def filter_rows(self, df, rows):
+        return rows[self.values_mask(np.asarray(df[self.field.name])[rows].astype(float))]
+
+    def values_mask(self, values):
+        # comparisons against NaN are False, just like in to_lambda()
+        with np.errstate(invalid='ignore'):
+            mask = values >= self.start
+
+            if self.include_end:
+                mask &= values <= self.end
+            else:
+                mask &= values < self.end
+
+        return mask
+
 class AndPredicate(Predicate):
     def __init__(self, predicates):
         self.predicates = predicates
@@ -106,6 +226,10 @@ class AndPredicate(Predicate):
             'predicates': [p.to_json() for p in self.predicates]
         }
 
+    def to_key(self):
+        # the order of conjuncts does not change the result
+        return json.dumps(['And'] + sorted(p.to_key() for p in self.predicates))
+
     def to_lambda(self):
         fs = [p.to_lambda() for p in self.predicates]
 
@@ -115,4 +239,38 @@ class AndPredicate(Predicate):
                     return False
             return True
         
-        return all
\ No newline at end of file
+        return all
+
+    def is_empty(self, zone_map):
+        return any(p.is_empty(zone_map) for p in self.predicates)
+
+    def to_mask(self, df):
+        mask = np.ones(len(df), dtype=bool)
+
+        for p in self.predicates:
+            # no need to look at the remaining columns once nothing matches
+            if not mask.any():
+                break
+
+            mask &= p.to_mask(df)
+
+        return mask
+
+    def to_rows(self, bitmap_index, df):
+        bitmaps = [p.to_bitmap(bitmap_index) for p in self.predicates]
+        indexed = sorted([bitmap for bitmap in bitmaps if bitmap is not None], key=len)
+
+        if len(indexed) == 0:
+            return None
+
+        # start from the most selective bitmap so that the cost is bounded by its matches
+        rows = indexed[0].to_rows()
+
+        for bitmap in indexed[1:]:
+            rows = bitmap.intersect(rows)
+
+        for p, bitmap in zip(self.predicates, bitmaps):
+            if bitmap is None and len(rows) > 0:
+                rows = p.filter_rows(df, rows)
+
+        return rows
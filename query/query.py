@@ -2,40 +2,76 @@ import random
 import time
 import math
 
+import numpy as np
+
 from .job import *
 from .predicate import Predicate
-from accum import AggregateValue, AllAccumulator
+from .stopping import StoppingRule
+from accum import GroupedCounts, GroupedAggregates, BinnedCounts
 from enum import Enum
 
-accum = AllAccumulator()
 NULL_ID = 9007199254740991
 
 def now():
     return int(time.time() * 1000)
 
-def dict_to_list(dic):
-    res = []
-
-    for key, value in dic.items():
-        if isinstance(key, float) and math.isnan(key):
-            key = None
-        elif isinstance(key, list) or isinstance(key, tuple):
-            key = [None if isinstance(x, float) and math.isnan(x) else x for x in key]
-
-        if isinstance(key, str) or isinstance(key, int):
-            key = ((key, ), )
-        elif key is None:
-            key = ((None, ), )
-        else:
-            key = (key, )
-        
-        res.append(key + value.to_tuple())
-    
-    return res
+def to_label(key):
+    """ replaces NaN with None in a key (or a tuple of keys) so that it can be serialized """
+    if isinstance(key, float) and math.isnan(key):
+        return None
+    elif isinstance(key, list) or isinstance(key, tuple):
+        return [None if isinstance(x, float) and math.isnan(x) else x for x in key]
+
+    return key
+
+def to_row(key, values):
+    """ formats a group of a result as (key, sum, ssum, count, min, max, null_count) """
+    key = to_label(key)
+
+    if isinstance(key, str) or isinstance(key, int):
+        key = ((key, ), )
+    elif key is None:
+        key = ((None, ), )
+    else:
+        key = (key, )
+
+    # min and max are NaN for groups without a non-null value, which is not valid JSON
+    return key + tuple(None if isinstance(x, float) and math.isnan(x) else x for x in values)
+
+def dictionary_of(field):
+    # only fields of a local dataset have dictionaries
+    return getattr(field, 'dictionary', None)
+
+def counts_to_list(items):
+    return [to_row(key, (0, 0, count, 0, 0, 0)) for key, count in items]
+
+def to_columns(keys, values):
+    """ formats (keys, values) of an accumulator as typed arrays, which are sent as binary attachments.
+    values are float64 in column-major order, and the bins of a histogram are int32 in row-major order with -1 for nulls """
+    values = np.asarray(values, dtype='<f8')
+
+    # counts are a vector, while the stats of aggregates already have a column for each statistic even if there is no group
+    if values.ndim == 1:
+        values = values.reshape(len(values), 1)
+
+    columns = {
+        'encoding': 'columnar',
+        'length': len(values),
+        'columns': ['sum', 'ssum', 'count', 'min', 'max', 'nullCount'] if values.shape[1] == 6 else ['count'],
+        'values': np.ascontiguousarray(values.T).tobytes()
+    }
+
+    if isinstance(keys, np.ndarray):
+        columns.update({'bins': keys.astype('<i4').tobytes(), 'dimensions': keys.shape[1]})
+    else:
+        columns.update({'keys': [to_label(key) for key in keys]})
+
+    return columns
 
 class QueryState(Enum):
     Running = 'Running'
     Paused = 'Paused'
+    Converged = 'Converged'
 
 class Query:
     id = 1
@@ -48,22 +84,39 @@ class Query:
 
         self.num_processed_rows = 0
         self.num_processed_blocks = 0     
+        self.remaining_rows = {} # sample index -> rows left, for samples that are processed in slices
         self.last_updated = now()
         
         self.result = {} # dict with keys
         self.state = QueryState.Running
         self.order = 0
+        self.stop_when = None # a StoppingRule, if the query can finish before all blocks are processed
 
         Query.id += 1
 
     def resume(self):
-        self.state = QueryState.Running
+        if self.state != QueryState.Converged:
+            self.state = QueryState.Running
     
     def pause(self):
-        self.state = QueryState.Paused
+        if self.state != QueryState.Converged:
+            self.state = QueryState.Paused
+
+    def converge(self):
+        self.state = QueryState.Converged
 
     @staticmethod
     def from_json(json, dataset):
+        query = Query.create(json, dataset)
+
+        # a query that does not support the rule ignores stopWhen, and its JSON has no stopWhen
+        if StoppingRule.supports(query):
+            query.stop_when = StoppingRule.from_json(json.get('stopWhen'))
+
+        return query
+
+    @staticmethod
+    def create(json, dataset):
         type_string = json['type']
         where_string = json['where']
 
@@ -110,24 +163,52 @@ class Query:
 
         raise f'Unknown query type: {json}'
     
-    def to_json(self):
+    def get_columns(self, since=None):
+        return to_columns(*self.result.columns(since))
+
+    def to_json(self, since=None, encoding='json'):
+        """ if since is given, the result only has the groups that changed after the version since.
+        if encoding is 'columnar', the result is a set of typed arrays (see to_columns) """
         json = {
             'id': self.id,
             'numProcessedRows': self.num_processed_rows,
             'numProcessedBlocks': self.num_processed_blocks,
             'lastUpdated': self.last_updated,
-            'result': self.get_result(),
+            'result': self.get_columns(since) if encoding == 'columnar' else self.get_result(since),
+            'version': self.result.version,
             'order': self.order,
             'state': self.state.value
         }
 
+        if since is not None:
+            json.update({'since': since})
+
         if self.where is not None:
             json.update({'where': self.where.to_json()})
 
+        if self.stop_when is not None:
+            json.update({'stopWhen': self.stop_when.to_json()})
+
         return json
 
+    def processed(self, sample):
+        """ counts the rows of sample, which can be a slice of a block, and the block once all of its rows are processed.
+        returns True if the block is done """
+        block = getattr(sample, 'parent', sample)
+        remaining = self.remaining_rows.get(block.index, block.num_rows) - sample.num_rows
+
+        self.num_processed_rows += sample.num_rows
+
+        if remaining > 0:
+            self.remaining_rows[block.index] = remaining
+            return False
+
+        self.remaining_rows.pop(block.index, None)
+        self.num_processed_blocks += 1
+        return True
+
     def done(self):
-        return self.num_processed_blocks == len(self.dataset.samples)
+        return self.state == QueryState.Converged or self.num_processed_blocks == len(self.dataset.samples)
 
 class SelectQuery(Query):
     name = 'Select'
@@ -168,6 +249,7 @@ class AggregateQuery(Query):
         self.grouping = grouping
         self.where = where
         self.dataset = dataset
+        self.result = GroupedAggregates([dictionary_of(grouping)])
 
     def get_jobs(self):
         jobs = []
@@ -185,19 +267,13 @@ class AggregateQuery(Query):
         return jobs
 
     def accumulate(self, res):
-        for name, sum, ssum, count, min, max, null_count in res:
-            if name not in self.result:
-                self.result[name] = AggregateValue(sum, ssum, count, min, max, null_count)
-            else:
-                partial = AggregateValue(sum, ssum, count, min, max, null_count)
+        self.result.add(res)
 
-                self.result[name] = accum.accumulate(self.result[name], partial)
+    def get_result(self, since=None):
+        return [to_row(key, values) for key, *values in self.result.items(since)]
 
-    def get_result(self):
-        return dict_to_list(self.result)
-
-    def to_json(self):
-        json = super().to_json()
+    def to_json(self, since=None, encoding='json'):
+        json = super().to_json(since, encoding)
         json.update({
             'grouping': self.grouping.to_json(),
             'target': self.target.to_json(),
@@ -238,6 +314,7 @@ class Histogram1DQuery(Query):
         self.bin_spec = bin_spec
         self.where = where
         self.dataset = dataset
+        self.result = BinnedCounts(bin_spec.num_bins + 1)
         
     def get_jobs(self):
         jobs = []
@@ -255,19 +332,13 @@ class Histogram1DQuery(Query):
         return jobs
 
     def accumulate(self, res):
-        for name, count in res:
-            if name not in self.result:
-                self.result[name] = AggregateValue(0, 0, count, 0, 0, 0)
-            else:
-                partial = AggregateValue(0, 0, count, 0, 0, 0)
-
-                self.result[name] = accum.accumulate(self.result[name], partial)
+        self.result.add(res)
 
-    def get_result(self):
-        return dict_to_list(self.result)
+    def get_result(self, since=None):
+        return counts_to_list(self.result.items(since))
 
-    def to_json(self):
-        json = super().to_json()
+    def to_json(self, since=None, encoding='json'):
+        json = super().to_json(since, encoding)
         json.update({
             'grouping': self.grouping.to_json(),
             'type': Histogram1DQuery.name
@@ -287,6 +358,7 @@ class Histogram2DQuery(Query):
         self.bin_spec2 = bin_spec2
         self.where = where
         self.dataset = dataset
+        self.result = BinnedCounts((bin_spec1.num_bins + 1, bin_spec2.num_bins + 1))
         
     def get_jobs(self):
         jobs = []
@@ -305,19 +377,13 @@ class Histogram2DQuery(Query):
         return jobs
 
     def accumulate(self, res):
-        for name, count in res:
-            if name not in self.result:
-                self.result[name] = AggregateValue(0, 0, count, 0, 0, 0)
-            else:
-                partial = AggregateValue(0, 0, count, 0, 0, 0)
+        self.result.add(res)
 
-                self.result[name] = accum.accumulate(self.result[name], partial)
+    def get_result(self, since=None):
+        return counts_to_list(self.result.items(since))
 
-    def get_result(self):
-        return dict_to_list(self.result)
-
-    def to_json(self):
-        json = super().to_json()
+    def to_json(self, since=None, encoding='json'):
+        json = super().to_json(since, encoding)
         json.update({
             'grouping1': self.grouping1.to_json(),
             'grouping2': self.grouping2.to_json(),
@@ -335,6 +401,7 @@ class Frequency1DQuery(Query):
         self.grouping = grouping
         self.where = where
         self.dataset = dataset
+        self.result = GroupedCounts([dictionary_of(grouping)])
 
     def get_jobs(self):
         jobs = []
@@ -351,19 +418,13 @@ class Frequency1DQuery(Query):
         return jobs
 
     def accumulate(self, res):
-        for name, count in res:
-            if name not in self.result:
-                self.result[name] = AggregateValue(0, 0, count, 0, 0, 0)
-            else:
-                partial = AggregateValue(0, 0, count, 0, 0, 0)
-
-                self.result[name] = accum.accumulate(self.result[name], partial)
-                
-    def get_result(self):
-        return dict_to_list(self.result)
-
-    def to_json(self):
-        json = super().to_json()
+        self.result.add(res)
+
+    def get_result(self, since=None):
+        return counts_to_list(self.result.items(since))
+
+    def to_json(self, since=None, encoding='json'):
+        json = super().to_json(since, encoding)
         json.update({
             'grouping': self.grouping.to_json(),
             'type': Frequency1DQuery.name
@@ -381,6 +442,7 @@ class Frequency2DQuery(Query):
         self.grouping2 = grouping2
         self.where = where
         self.dataset = dataset
+        self.result = GroupedCounts([dictionary_of(grouping1), dictionary_of(grouping2)])
 
     def get_jobs(self):
         jobs = []
@@ -397,19 +459,13 @@ class Frequency2DQuery(Query):
         return jobs
 
     def accumulate(self, res):
-        for name, count in res:
-            if name not in self.result:
-                self.result[name] = AggregateValue(0, 0, count, 0, 0, 0)
-            else:
-                partial = AggregateValue(0, 0, count, 0, 0, 0)
-
-                self.result[name] = accum.accumulate(self.result[name], partial)
+        self.result.add(res)
 
-    def get_result(self):
-        return dict_to_list(self.result)
+    def get_result(self, since=None):
+        return counts_to_list(self.result.items(since))
 
-    def to_json(self):
-        json = super().to_json()
+    def to_json(self, since=None, encoding='json'):
+        json = super().to_json(since, encoding)
         json.update({
             'grouping1': self.grouping1.to_json(),
             'grouping2': self.grouping2.to_json(),
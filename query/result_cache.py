@@ -0,0 +1,86 @@
+from collections import OrderedDict
+
+import numpy as np
+
+OBJECT_BYTES = 64 # the estimated size of a Python object, e.g., a label or a number in a row
+
+def result_bytes(result):
+    """ estimates the size of a partial result, which is an array, a tuple of arrays (and lists of keys), or a list of rows """
+    if isinstance(result, np.ndarray):
+        if result.dtype == object:
+            return result.nbytes + len(result) * OBJECT_BYTES
+
+        return result.nbytes
+
+    if isinstance(result, tuple):
+        return sum(result_bytes(part) for part in result)
+
+    if isinstance(result, list):
+        # rows of the same partial result have the same length
+        width = len(result[0]) if len(result) > 0 and isinstance(result[0], (tuple, list)) else 1
+        return len(result) * width * OBJECT_BYTES
+
+    return OBJECT_BYTES
+
+class ResultCache:
+    """ keeps the partial results of the most recently run jobs so that repeated queries skip them,
+    within a number of results and a budget of bytes """
+
+    def __init__(self, capacity, budget):
+        self.capacity = capacity
+        self.budget = budget
+        self.entries = OrderedDict() # job signature -> (partial result, bytes)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, job):
+        """ returns the cached partial result of job, or None """
+        signature = job.signature()
+
+        if signature is None or self.capacity <= 0:
+            return None
+
+        if signature in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(signature)
+            return self.entries[signature][0]
+
+        self.misses += 1
+        return None
+
+    def put(self, job, result):
+        signature = job.signature()
+
+        if signature is None or self.capacity <= 0:
+            return
+
+        size = result_bytes(result)
+
+        # a result that alone exceeds the budget would evict everything else
+        if size > self.budget:
+            return
+
+        if signature in self.entries:
+            self.bytes -= self.entries[signature][1]
+
+        self.entries[signature] = (result, size)
+        self.entries.move_to_end(signature)
+        self.bytes += size
+
+        while len(self.entries) > self.capacity or self.bytes > self.budget:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            'capacity': self.capacity,
+            'budget': self.budget,
+            'bytes': self.bytes,
+            'numResults': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
@@ -0,0 +1,195 @@
+from statistics import NormalDist
+
+import numpy as np
+
+from .estimate import key_id
+
+NORMAL = NormalDist()
+NUM_DRAWS = 1000 # the number of draws to estimate the confidence of rank and distributive safeguards
+
+def query_id_of(json):
+    query = json.get('query')
+    return query.get('id') if isinstance(query, dict) else query
+
+class Safeguard:
+    """ a claim about the result of a query that is re-evaluated on the server whenever the result changes.
+    its confidence is the probability that the claim holds under the normal approximation of the estimates """
+
+    def __init__(self, json, query):
+        self.json = json
+        self.query = query
+        self.threshold = json.get('threshold', 0.95)
+        self.version = None
+
+    @staticmethod
+    def from_json(json, query):
+        """ returns the safeguard of json on query, or None if it cannot be evaluated on the server """
+        type_string = json.get('type')
+
+        if type_string == ValueSafeguard.name:
+            return ValueSafeguard(json, query)
+        elif type_string == RangeSafeguard.name:
+            return RangeSafeguard(json, query)
+        elif type_string == ComparativeSafeguard.name:
+            return ComparativeSafeguard(json, query)
+        elif type_string == RankSafeguard.name:
+            return RankSafeguard(json, query)
+        elif type_string == DistributiveSafeguard.name:
+            return DistributiveSafeguard(json, query)
+
+        return None
+
+    @staticmethod
+    def probability_above(mean, error, constant):
+        """ returns P(x > constant) for x ~ N(mean, error) """
+        if error == 0 or np.isinf(error):
+            return float(mean > constant) if error == 0 else 0.5
+
+        return 1 - NORMAL.cdf((constant - mean) / error)
+
+    def confidence(self, estimates):
+        """ returns the probability that the claim holds, or None if the groups of the claim have not been seen """
+        return None
+
+    def update(self, estimates):
+        """ re-evaluates the safeguard, and returns True if its status or (rounded) confidence changed """
+        if self.version == self.query.result.version:
+            return False
+
+        self.version = self.query.result.version
+        confidence = self.confidence(estimates)
+
+        if confidence is None:
+            status = 'unknown'
+        elif confidence >= self.threshold:
+            status = 'valid'
+        elif confidence <= 1 - self.threshold:
+            status = 'invalid'
+        else:
+            status = 'uncertain'
+
+        if confidence is not None:
+            confidence = round(confidence, 2)
+
+        if self.json.get('status') == status and self.json.get('confidence') == confidence:
+            return False
+
+        self.json.update({
+            'status': status,
+            'confidence': confidence,
+            'numProcessedBlocks': self.query.num_processed_blocks
+        })
+
+        return True
+
+class ValueSafeguard(Safeguard):
+    """ the estimate of variable is less than (<, <=) or greater than (>, >=) constant """
+    name = 'value'
+
+    def confidence(self, estimates):
+        i = estimates.find(self.json['variable'])
+
+        if i is None:
+            return None
+
+        above = self.probability_above(estimates.values[i], estimates.errors[i], self.json['constant'])
+
+        return above if self.json['operator'] in ('>', '>=') else 1 - above
+
+class RangeSafeguard(Safeguard):
+    """ the estimate of variable is within range, [low, high] """
+    name = 'range'
+
+    def confidence(self, estimates):
+        i = estimates.find(self.json['variable'])
+
+        if i is None:
+            return None
+
+        low, high = self.json['range']
+        mean, error = estimates.values[i], estimates.errors[i]
+
+        return max(0, self.probability_above(mean, error, low) - self.probability_above(mean, error, high))
+
+class ComparativeSafeguard(Safeguard):
+    """ the estimate of variable1 is less than (<, <=) or greater than (>, >=) that of variable2 """
+    name = 'comparative'
+
+    def confidence(self, estimates):
+        i = estimates.find(self.json['variable1'])
+        j = estimates.find(self.json['variable2'])
+
+        if i is None or j is None:
+            return None
+
+        difference = estimates.values[i] - estimates.values[j]
+        error = np.sqrt(estimates.errors[i] ** 2 + estimates.errors[j] ** 2)
+        above = self.probability_above(difference, error, 0)
+
+        return above if self.json['operator'] in ('>', '>=') else 1 - above
+
+def draw(estimates, seed):
+    """ returns NUM_DRAWS x groups estimates drawn from their normal approximations """
+    errors = estimates.errors.copy()
+
+    # a group without a variance is as uncertain as the most uncertain of the others
+    finite = np.isfinite(errors)
+    errors[~finite] = errors[finite].max() if finite.any() else 0
+
+    rng = np.random.default_rng(seed)
+    return estimates.values + errors * rng.standard_normal((NUM_DRAWS, len(estimates)))
+
+class RankSafeguard(Safeguard):
+    """ the estimate of variable is among the rank largest ones, e.g., rank 1 means that it is the largest """
+    name = 'rank'
+
+    def confidence(self, estimates):
+        i = estimates.find(self.json['variable'])
+
+        if i is None:
+            return None
+
+        draws = draw(estimates, self.query.result.version)
+        ranks = (draws > draws[:, [i]]).sum(axis=1) + 1
+
+        return float(np.mean(ranks <= self.json['rank']))
+
+class DistributiveSafeguard(Safeguard):
+    """ the proportions of groups are within tolerance (in total variation distance, defaults to 0.05) of expected,
+    which is given as [[key, proportion], ...] or as a normal distribution {"mean": ..., "stdev": ...} over the bins of a histogram """
+    name = 'distributive'
+
+    def expected(self, estimates):
+        expected = np.zeros(len(estimates))
+
+        if 'expected' in self.json:
+            proportions = {key_id(key): proportion for key, proportion in self.json['expected']}
+            for i, key in enumerate(estimates.keys):
+                expected[i] = proportions.get(key_id(key), 0)
+
+            return expected
+
+        # the probability mass of each bin under the normal distribution
+        distribution = NormalDist(self.json['distribution']['mean'], self.json['distribution']['stdev'])
+        bin_spec = self.query.bin_spec
+        step = bin_spec.step()
+
+        for i, key in enumerate(estimates.keys):
+            if key is not None:
+                start = bin_spec.start + step * key
+                expected[i] = distribution.cdf(start + step) - distribution.cdf(start)
+
+        return expected
+
+    def confidence(self, estimates):
+        if len(estimates) == 0 or estimates.means:
+            return None
+
+        expected = self.expected(estimates)
+        draws = draw(estimates, self.query.result.version)
+
+        # expected proportions of groups that have not been seen yet count toward the distance
+        unseen = max(0, 1 - expected.sum())
+        distances = (np.abs(draws - expected).sum(axis=1) + unseen) / 2
+
+        return float(np.mean(distances <= self.json.get('tolerance', 0.05)))
@@ -0,0 +1,114 @@
+import numpy as np
+
+from . import kernel
+
+class ScanFrame:
+    """ a DataFrame-like view of the columns of a scan, which reads each column once per visit """
+
+    def __init__(self, scan):
+        self.scan = scan
+
+    def __len__(self):
+        return len(self.scan.df)
+
+    def __getitem__(self, name):
+        return self.scan.values(name)
+
+class SampleScan:
+    """ a single visit to a sample that is shared by all jobs targeting the sample """
+
+    def __init__(self, sample):
+        self.sample = sample
+        self.frame = None
+        self.cache = {}
+
+    @property
+    def df(self):
+        # hold on to the frame for the whole visit even if the sample is evicted meanwhile
+        if self.frame is None:
+            self.frame = self.sample.df
+
+        return self.frame
+
+    def cached(self, key, compute):
+        if key not in self.cache:
+            self.cache[key] = compute()
+
+        return self.cache[key]
+
+    @staticmethod
+    def where_key(where):
+        return where.to_key() if where is not None else None
+
+    def mask(self, where):
+        """ returns a boolean mask or sorted ids of rows that satisfy where, or None if there is no filter """
+        if where is None:
+            return None
+
+        def compute():
+            df = ScanFrame(self)
+            bitmap_index = getattr(self.sample, 'bitmap_index', None)
+
+            if bitmap_index is not None:
+                rows = where.to_rows(bitmap_index, df)
+
+                if rows is not None:
+                    return rows
+
+            return where.to_mask(df)
+
+        return self.cached(('mask', where.to_key()), compute)
+
+    def values(self, name):
+        """ returns all values of the column name """
+        return self.cached(('values', name), lambda: np.asarray(self.df[name]))
+
+    def column(self, name, where=None):
+        def compute():
+            values = self.values(name)
+            mask = self.mask(where)
+
+            if mask is None:
+                return values
+
+            return values[mask]
+
+        return self.cached(('column', name, self.where_key(where)), compute)
+
+    def codes(self, field, where=None):
+        """ returns (codes, keys) for the values of field, where nulls have the code -1 and keys
+        are dictionary codes if the field has a dictionary or labels otherwise """
+        dictionary = getattr(field, 'dictionary', None)
+
+        if dictionary is None:
+            return self.cached(('codes', field.name, self.where_key(where)),
+                lambda: kernel.factorize(self.column(field.name, where)))
+
+        def compute():
+            codes = self.column(field.name, where)
+
+            # keys are dictionary codes, which are translated to labels only when a result is serialized
+            if len(dictionary) <= kernel.MAX_DENSE_CODES:
+                return codes, np.arange(len(dictionary), dtype=codes.dtype)
+
+            # keep the codes dense when the dictionary is much larger than a sample
+            return kernel.factorize_codes(codes)
+
+        return self.cached(('codes', field.name, self.where_key(where)), compute)
+
+    def bin_indices(self, name, bin_spec, where=None):
+        return self.cached(('bins', name, bin_spec.start, bin_spec.end, bin_spec.num_bins, self.where_key(where)),
+            lambda: kernel.bin_indices(self.column(name, where), bin_spec))
+
+    def summarize(self):
+        """ fills the lazy zone map and frequency summaries of the sample from the columns that this visit read,
+        so that they are computed in the executor rather than when jobs are resolved on the thread that handles sockets """
+        # a slice does not cover the whole sample
+        if hasattr(self.sample, 'parent'):
+            return
+
+        names = [key[1] for key in self.cache if key[0] == 'values']
+
+        for summaries in (getattr(self.sample, 'zone_map', None), getattr(self.sample, 'frequencies', None)):
+            if hasattr(summaries, 'fill'):
+                summaries.fill(names, self.values)
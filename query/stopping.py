@@ -0,0 +1,82 @@
+from collections import deque
+from statistics import NormalDist
+
+import numpy as np
+
+from .estimate import Estimates
+
+class StoppingRule:
+    """ finishes a query before all blocks are processed once its estimates converge, i.e., when the confidence
+    intervals of all estimates are narrower than ci_width, or when no estimate changed more than max_change
+    over the last blocks. estimates are the means of groups for aggregates and the proportions of groups otherwise """
+
+    def __init__(self, ci_width=None, max_change=None, blocks=5, min_blocks=2, confidence=0.95):
+        self.ci_width = ci_width
+        self.max_change = max_change
+        self.blocks = blocks
+        self.min_blocks = min_blocks
+        self.confidence = confidence
+
+        self.z = NormalDist().inv_cdf((1 + confidence) / 2)
+        self.history = deque(maxlen=blocks + 1) # the estimates after each of the last blocks
+
+    # the confidence intervals of the rule describe means and proportions, not sums or the min and max of groups
+    AGGREGATES = ['mean', 'count']
+
+    @staticmethod
+    def supports(query):
+        return getattr(query, 'aggregate', 'count') in StoppingRule.AGGREGATES
+
+    @staticmethod
+    def from_json(json):
+        if json is None:
+            return None
+
+        return StoppingRule(json.get('ciWidth'), json.get('maxChange'), json.get('blocks', 5),
+            json.get('minBlocks', 2), json.get('confidence', 0.95))
+
+    def to_json(self):
+        json = {'blocks': self.blocks, 'minBlocks': self.min_blocks, 'confidence': self.confidence}
+
+        if self.ci_width is not None:
+            json['ciWidth'] = self.ci_width
+
+        if self.max_change is not None:
+            json['maxChange'] = self.max_change
+
+        return json
+
+    def converged(self, query):
+        """ is called whenever query finishes a block """
+        estimates = Estimates(query)
+        keys, means = estimates.keys, estimates.means
+        self.history.append(dict(zip(keys, estimates.values.tolist())))
+
+        if query.num_processed_blocks < self.min_blocks or len(keys) == 0:
+            return False
+
+        # the widths of means are relative to the means, while proportions are already relative to the total
+        scale = np.abs(estimates.values) if means else 1
+
+        if self.ci_width is not None and np.all(2 * self.z * estimates.errors <= self.ci_width * scale):
+            return True
+
+        if self.max_change is not None and len(self.history) == self.history.maxlen:
+            previous = self.history[0]
+
+            for key, estimate in zip(keys, estimates.values.tolist()):
+                if means and key not in previous:
+                    return False
+
+                before = previous.get(key, 0)
+                change = abs(estimate - before)
+
+                if means:
+                    change = change / abs(before) if before != 0 else (0 if change == 0 else np.inf)
+
+                if change > self.max_change:
+                    return False
+
+            return True
+
+        return False
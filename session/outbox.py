@@ -0,0 +1,51 @@
+class Outbox:
+    """ coalesces the updates of a session until they are flushed in one batch """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.started = {} # query id -> [num blocks, num rows]
+        self.ended = {} # query id -> num blocks
+        self.results = {} # query id -> query, only the latest result of a query is sent
+        self.safeguards = {} # safeguard id -> safeguard whose status changed
+        self.queries_changed = False
+
+    def __len__(self):
+        return len(self.started) + len(self.ended) + len(self.results) + len(self.safeguards) + int(self.queries_changed)
+
+    def start(self, query, num_rows):
+        ongoing = self.started.setdefault(query.id, [0, 0])
+        ongoing[0] += 1
+        ongoing[1] += num_rows
+
+    def end(self, query):
+        self.ended[query.id] = self.ended.get(query.id, 0) + 1
+
+    def result(self, query):
+        self.results[query.id] = query
+
+    def safeguard_changes(self, safeguards):
+        self.safeguards.update(safeguards)
+
+    def queries(self):
+        self.queries_changed = True
+
+    def take(self):
+        """ returns the status events as [[name, data], ...], the queries whose results changed,
+        and whether the states of queries changed, and then empties the outbox """
+        events = [['STATUS/job/start', {'id': query_id, 'numOngoingBlocks': blocks, 'numOngoingRows': rows}]
+            for query_id, (blocks, rows) in self.started.items()]
+
+        events += [['STATUS/job/end', {'id': query_id, 'numBlocks': blocks}]
+            for query_id, blocks in self.ended.items()]
+
+        if len(self.safeguards) > 0:
+            events.append(['STATUS/safeguards/changes', self.safeguards])
+
+        queries = list(self.results.values())
+        queries_changed = self.queries_changed
+
+        self.clear()
+
+        return events, queries, queries_changed
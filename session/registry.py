@@ -0,0 +1,41 @@
+class SessionRegistry:
+    """ sessions indexed by their code and by the sids of their clients """
+
+    def __init__(self):
+        self.sessions = []
+        self.by_code = {}
+        self.by_sid = {}
+
+    def __iter__(self):
+        return iter(self.sessions)
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def add(self, session):
+        self.sessions.append(session)
+        self.by_code[session.code] = session
+
+    def get(self, code):
+        return self.by_code.get(code)
+
+    def get_by_sid(self, sid):
+        return self.by_sid.get(sid)
+
+    def enter(self, sid, session):
+        """ moves sid to session, and returns the session that sid left (or None) """
+        left = self.leave(sid)
+
+        session.enter_sid(sid)
+        self.by_sid[sid] = session
+
+        return left
+
+    def leave(self, sid):
+        """ removes sid from its session, and returns the session (or None) """
+        session = self.by_sid.pop(sid, None)
+
+        if session is not None:
+            session.leave_sid(sid)
+
+        return session
@@ -1,6 +1,8 @@
 import random
 import string
 from job_queue import JobQueue
+from query import Safeguard, Estimates, query_id_of
+from .outbox import Outbox
 
 SAFEGUARD_ID = 1
 
@@ -11,7 +13,7 @@ class Session:
         
     def __init__(self):
         self.code = Session.generate_code()
-        self.sids = [] 
+        self.sids = set()
 
         # most recent to the front
         self.queries = []
@@ -19,9 +21,19 @@ class Session:
         # most recent to the front
         self.safeguards = []
 
+        # safeguard id -> Safeguard, for safeguards that are evaluated on the server
+        self.monitors = {}
+
         self.job_queue = JobQueue()
         self.alternate = False
 
+        # a session gets a share of the backend in proportion to its weight,
+        # and runs at most quota job batches at the same time (0 for no limit)
+        self.weight = 1
+        self.quota = 0
+
+        self.outbox = Outbox()
+
     def to_json(self):
         return {
             'code': self.code,
@@ -32,11 +44,10 @@ class Session:
         }
     
     def leave_sid(self, sid):
-        self.sids = [s for s in self.sids if s != sid]
+        self.sids.discard(sid)
 
     def enter_sid(self, sid):
-        if sid not in self.sids:
-            self.sids.append(sid)
+        self.sids.add(sid)
 
     def get_query(self, query_id):
         for q in self.queries:
@@ -57,26 +68,44 @@ class Session:
     def pause_query(self, query):
         query.pause()
         self.job_queue.pause_by_query_id(query.id)
-        self.job_queue.reschedule(self.alternate)
 
     def resume_query(self, query):
         query.resume()
         self.job_queue.resume_by_query_id(query.id)
-        self.job_queue.reschedule(self.alternate)
 
     def remove_query(self, query):
         self.queries = [q for q in self.queries if q != query]        
+        self.monitors = {id: monitor for id, monitor in self.monitors.items() if monitor.query is not query}
         self.job_queue.remove_by_query_id(query.id)
-        self.job_queue.reschedule(self.alternate)
 
     def add_safeguard(self, safeguard):
         global SAFEGUARD_ID
         self.safeguards.insert(0, safeguard)
         safeguard['id'] = SAFEGUARD_ID
         SAFEGUARD_ID += 1
+
+        query = self.get_query(query_id_of(safeguard))
+        monitor = Safeguard.from_json(safeguard, query) if query is not None else None
+
+        if monitor is not None:
+            self.monitors[safeguard['id']] = monitor
+            monitor.update(Estimates(query))
     
     def remove_safeguard(self, safeguard):
         self.safeguards = [sg for sg in self.safeguards if sg['id'] != safeguard['id']]
+        self.monitors.pop(safeguard['id'], None)
+
+    def evaluate_safeguards(self, query):
+        """ re-evaluates the safeguards on query and returns {id: safeguard} of those whose status or confidence changed """
+        monitors = [monitor for monitor in self.monitors.values() if monitor.query is query]
+
+        if len(monitors) == 0:
+            return {}
+
+        # all safeguards on a query share the estimates
+        estimates = Estimates(query)
+
+        return {monitor.json['id']: monitor.json for monitor in monitors if monitor.update(estimates)}
 
     def reschedule(self):
         self.job_queue.reschedule(self.alternate)
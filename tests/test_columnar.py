@@ -0,0 +1,30 @@
+import numpy as np
+
+from accum import GroupedCounts, GroupedAggregates, BinnedCounts
+from dataset import Dictionary
+from query import to_columns
+
+def test_empty_counts():
+    columns = to_columns(*GroupedCounts([Dictionary()]).columns())
+
+    assert columns['length'] == 0
+    assert columns['columns'] == ['count']
+    assert columns['values'] == b''
+    assert columns['keys'] == []
+
+def test_empty_aggregates():
+    columns = to_columns(*GroupedAggregates([Dictionary()]).columns())
+
+    assert columns['length'] == 0
+    assert columns['columns'] == ['sum', 'ssum', 'count', 'min', 'max', 'nullCount']
+    assert columns['values'] == b''
+
+def test_empty_delta():
+    counts = BinnedCounts((11, 11))
+    counts.add(np.ones((11, 11), dtype=np.int64))
+
+    columns = to_columns(*counts.columns(since=counts.version))
+
+    assert columns['length'] == 0
+    assert columns['bins'] == b''
+    assert columns['dimensions'] == 2
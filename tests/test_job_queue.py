@@ -0,0 +1,126 @@
+from functools import cmp_to_key
+
+from job_queue import JobQueue
+from query import Job, JobState
+
+class FakeQuery:
+    def __init__(self, id, order):
+        self.id = id
+        self.order = order
+        self.priority = 1
+        self.client_socket_id = 'sid'
+        self.num_processed_blocks = 0
+
+class FakeSample:
+    pass
+
+def jobs_of(query, num_jobs):
+    jobs = []
+
+    for i in range(num_jobs):
+        job = Job(i)
+        job.query = query
+        job.sample = FakeSample()
+        jobs.append(job)
+
+    return jobs
+
+class SortedJobQueue:
+    """ the job queue before per-query queues, which sorted all jobs whenever queries changed """
+
+    def __init__(self):
+        self.queue = []
+
+    def append(self, jobs):
+        self.queue += jobs
+
+    def peep(self):
+        return self.queue[0] if len(self.queue) > 0 else None
+
+    def dequeue(self):
+        return self.queue.pop(0)
+
+    def remove_by_query_id(self, query_id):
+        self.queue = [job for job in self.queue if job.query.id != query_id]
+        self.reschedule(True)
+
+    def pause_by_query_id(self, query_id):
+        for job in self.queue:
+            if job.query.id == query_id:
+                job.pause()
+
+        self.reschedule(True)
+
+    def resume_by_query_id(self, query_id):
+        for job in self.queue:
+            if job.query.id == query_id:
+                job.resume()
+
+        self.reschedule(True)
+
+    def reschedule(self, alternate):
+        def cmp(a, b):
+            if a.query.priority != b.query.priority:
+                return a.query.priority - b.query.priority
+
+            if a.state != b.state:
+                return 1 if a.state == JobState.Paused else -1
+
+            a_index = a.index - a.query.num_processed_blocks
+            b_index = b.index - b.query.num_processed_blocks
+
+            if a_index != b_index:
+                return a_index - b_index
+
+            return a.query.order - b.query.order
+
+        self.queue.sort(key=cmp_to_key(cmp))
+
+def run(queue, queries, steps):
+    """ dequeues a job at each step, or applies an action (e.g., ('pause', 'A')) to the queue """
+    order = []
+
+    for step in steps:
+        if step == 'next':
+            job = queue.peep()
+
+            if job is None or job.state == JobState.Paused:
+                order.append(None)
+                continue
+
+            queue.dequeue()
+            job.query.num_processed_blocks += 1
+            order.append(f'{job.query.id}{job.index}')
+        else:
+            action, query_id = step
+            getattr(queue, f'{action}_by_query_id')(query_id)
+
+    return order
+
+def simulate(queue_type, steps):
+    queries = {'A': FakeQuery('A', 0), 'B': FakeQuery('B', 1), 'C': FakeQuery('C', 2)}
+    queue = queue_type()
+
+    for query in queries.values():
+        queue.append(jobs_of(query, 20))
+
+    queue.reschedule(True)
+
+    return run(queue, queries, steps)
+
+def check(steps):
+    assert simulate(JobQueue, steps) == simulate(SortedJobQueue, steps)
+
+def test_alternate():
+    check(['next'] * 30)
+
+def test_alternate_pause_resume():
+    check(['next'] * 4 + [('pause', 'A')] + ['next'] * 6 + [('resume', 'A')] + ['next'] * 20)
+
+def test_alternate_pause_all():
+    check(['next'] * 3 + [('pause', 'A'), ('pause', 'B'), ('pause', 'C')] + ['next'] * 2 +
+        [('resume', 'B')] + ['next'] * 5 + [('resume', 'C'), ('resume', 'A')] + ['next'] * 20)
+
+def test_alternate_remove():
+    check(['next'] * 5 + [('pause', 'C')] + ['next'] * 4 + [('remove', 'B')] + ['next'] * 4 +
+        [('resume', 'C')] + ['next'] * 20)
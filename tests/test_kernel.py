@@ -0,0 +1,41 @@
+import numpy as np
+
+from query import kernel, BinSpec
+
+def spark_bin(value, bin_spec):
+    """ the per-row bin of the Spark jobs before they were rewritten as DataFrame expressions """
+    if value is None:
+        return bin_spec.num_bins
+
+    x = int((value - bin_spec.start) // bin_spec.step())
+    return max(min(x, bin_spec.num_bins - 1), 0)
+
+def test_edges():
+    bin_spec = BinSpec(0, 10, 5)
+
+    # an edge belongs to the bin on its right, and end belongs to the last bin
+    indices = kernel.bin_indices([0, 2, 4, 6, 8, 10], bin_spec)
+
+    assert indices.tolist() == [0, 1, 2, 3, 4, 4]
+
+def test_clamp_and_nulls():
+    bin_spec = BinSpec(0, 10, 5)
+
+    indices = kernel.bin_indices([-1, 1.999, 12, np.nan], bin_spec)
+
+    assert indices.tolist() == [0, 0, 4, 5]
+
+def test_spark_bins():
+    bin_spec = BinSpec(0, 3e8, 40)
+    values = [bin_spec.start + bin_spec.step() * i for i in range(41)] + [-5, 0.5, 3e8 + 1, 7499999.9, 7500000.1]
+
+    indices = kernel.bin_indices(values + [np.nan], bin_spec)
+
+    assert indices.tolist() == [spark_bin(value, bin_spec) for value in values + [None]]
+
+def test_histogram1d():
+    bin_spec = BinSpec(0, 10, 5)
+
+    counts = kernel.histogram1d(kernel.bin_indices([0, 2, 2, 10, np.nan], bin_spec), bin_spec.num_bins)
+
+    assert counts.tolist() == [1, 2, 0, 0, 1, 1]
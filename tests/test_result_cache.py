@@ -0,0 +1,41 @@
+import numpy as np
+
+from query.result_cache import ResultCache, result_bytes
+
+class FakeJob:
+    def __init__(self, signature):
+        self.signature = lambda: signature
+
+def test_result_bytes():
+    keys, counts = np.arange(10, dtype=np.int32), np.ones(10, dtype=np.int64)
+
+    assert result_bytes(counts) == 80
+    assert result_bytes((keys, counts)) == 120
+    assert result_bytes(((keys, keys), counts)) == 160
+
+def test_budget():
+    cache = ResultCache(100, 2000)
+
+    for i in range(3):
+        cache.put(FakeJob(i), np.zeros(100))
+
+    # each result takes 800 bytes, so only the last two fit
+    assert cache.get(FakeJob(0)) is None
+    assert cache.get(FakeJob(1)) is not None
+    assert cache.get(FakeJob(2)) is not None
+    assert cache.bytes == 1600
+
+def test_too_large():
+    cache = ResultCache(100, 2000)
+    cache.put(FakeJob(0), np.zeros(10))
+    cache.put(FakeJob(1), np.zeros(1000))
+
+    assert cache.get(FakeJob(0)) is not None
+    assert cache.get(FakeJob(1)) is None
+
+def test_replace():
+    cache = ResultCache(100, 2000)
+    cache.put(FakeJob(0), np.zeros(100))
+    cache.put(FakeJob(0), np.zeros(10))
+
+    assert cache.bytes == 80
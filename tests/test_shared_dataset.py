@@ -0,0 +1,22 @@
+import numpy as np
+import pyarrow as pa
+
+from dataset import ArrowFrame, Dictionary, LocalSample, SharedColumns, NULL_CODE
+
+def test_lazy_frames():
+    dictionary = Dictionary()
+
+    frame = ArrowFrame(pa.table({'Genre': ['Drama', 'Action', None, 'Drama'], 'Score': [1.0, None, 3.0, 4.0]}))
+    frame.dictionaries = {'Genre': dictionary}
+
+    samples = [LocalSample(0, frame.slice(0, 3)), LocalSample(1, frame.slice(3, 4))]
+    columns = SharedColumns(samples)
+
+    try:
+        frames = columns.frames()
+
+        assert frames[0]['Genre'].tolist() == [dictionary.code('Drama'), dictionary.code('Action'), NULL_CODE]
+        assert frames[1]['Genre'].tolist() == [dictionary.code('Drama')]
+        assert np.array_equal(frames[0]['Score'], [1.0, np.nan, 3.0], equal_nan=True)
+    finally:
+        columns.close()
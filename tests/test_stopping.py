@@ -0,0 +1,38 @@
+import configparser
+import os
+
+import pytest
+
+from backend import LocalBackend
+from query import Query
+
+MOVIES = os.path.join(os.path.dirname(__file__), '..', 'data', 'movies')
+
+@pytest.fixture(scope='module')
+def dataset():
+    config = configparser.ConfigParser()
+    config.read_string(f'[server]\nversion=test\n[backend]\ntype=local\ndataset={MOVIES}\nsample_rows=1000\n')
+
+    backend = LocalBackend(config)
+    yield backend.load(MOVIES)
+    backend.stop()
+
+def aggregate(dataset, aggregate):
+    field = lambda name: dataset.get_field_by_name(name).to_json()
+
+    return Query.from_json({'type': 'Aggregate', 'where': None, 'aggregate': aggregate,
+        'target': field('Budget'), 'grouping': field('Genre'), 'stopWhen': {'ciWidth': 0.1}}, dataset)
+
+@pytest.mark.parametrize('name', ['mean', 'count'])
+def test_supported(dataset, name):
+    query = aggregate(dataset, name)
+
+    assert query.stop_when is not None
+    assert 'stopWhen' in query.to_json()
+
+@pytest.mark.parametrize('name', ['sum', 'min', 'max'])
+def test_unsupported(dataset, name):
+    query = aggregate(dataset, name)
+
+    assert query.stop_when is None
+    assert 'stopWhen' not in query.to_json()
@@ -0,0 +1,81 @@
+import argparse
+import os
+import json
+import math
+import pandas as pd
+
+from tqdm import tqdm
+
+parser = argparse.ArgumentParser(description='Write the number of rows, zone maps, and value counts of each batch into metadata.json')
+parser.add_argument('dataset_path', metavar='<path to dataset>', type=str, help='Directory that has metadata.json')
+
+parser.add_argument('--no-frequencies', dest='frequencies', action='store_false', default=True, help='do not count the values of nominal and ordinal fields')
+
+args = parser.parse_args()
+
+def read_batch(path):
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension in ['.arrow', '.feather', '.ipc']:
+        return pd.read_feather(path)
+    elif extension == '.parquet':
+        return pd.read_parquet(path)
+
+    with open(path, encoding='utf8') as fin:
+        return pd.DataFrame.from_records(json.load(fin))
+
+def to_label(value):
+    if isinstance(value, float) and math.isnan(value):
+        return None
+
+    # numpy scalars are not JSON serializable
+    return value.item() if hasattr(value, 'item') else value
+
+def main():
+    metadata_path = os.path.join(args.dataset_path, 'metadata.json')
+
+    with open(metadata_path, encoding='utf8') as fin:
+        metadata = json.load(fin)
+
+    if 'batches' not in metadata['source']:
+        print('Only a dataset with "batches" can be summarized, as a single source is split when the server starts up')
+        return
+
+    fields = metadata['fields']
+
+    for batch in tqdm(metadata['source']['batches']):
+        df = read_batch(os.path.join(args.dataset_path, batch['path']))
+
+        batch['numRows'] = len(df)
+
+        zone_map = {}
+        frequencies = {}
+
+        for field in fields:
+            name = field['name']
+
+            if name not in df.columns:
+                continue
+
+            if field['vlType'] == 'quantitative':
+                values = pd.to_numeric(df[name], errors='coerce')
+                null_count = int(values.isna().sum())
+
+                if null_count == len(values):
+                    zone_map[name] = {'min': None, 'max': None, 'nullCount': null_count}
+                else:
+                    zone_map[name] = {'min': float(values.min()), 'max': float(values.max()), 'nullCount': null_count}
+            elif field['vlType'] in ['nominal', 'ordinal'] and args.frequencies:
+                counts = df[name].value_counts(dropna=False)
+                frequencies[name] = [[to_label(label), int(count)] for label, count in counts.items()]
+
+        batch['zoneMap'] = zone_map
+
+        if args.frequencies:
+            batch['frequencies'] = frequencies
+
+    with open(metadata_path, 'w', encoding='utf8') as fout:
+        json.dump(metadata, fout, indent=4, ensure_ascii=False)
+
+if __name__ == '__main__':
+    main()